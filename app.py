@@ -2,48 +2,114 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import json
-import dateutil.parser
-import babel
-from flask import Flask, jsonify, render_template, request, Response, flash, redirect, url_for, abort
-from flask_moment import Moment
+from flask import Flask, current_app, jsonify, render_template, request, Response, flash, redirect, url_for, abort, stream_with_context
+from jinja2 import FileSystemBytecodeCache
 import logging
-from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-import sys
-
-from models import Venue, Artist, Show, db, migrate
-from utils import filter_past_shows, filter_upcoming_shows
+from forms import VenueForm, ArtistForm, ShowForm
+import os
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from models import Venue, Artist, Show, VenueArea, VenueAreaGenre, db, listing_version
+from utils import keyset_page
+from search import search
+from suggest import suggestions
+from matching import matches
+from cache import cache, conditional
+from fragments import fragments
+from assets import assets, assets_command
+from importer import import_command
+from export import export_command, stream
+from booking import book, BookingError
+import counters
+import areas
+from metrics import instrumentation
+from logs import logs
+from sqlalchemy.exc import IntegrityError
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-app.config.from_object('config')
-db.init_app(app)
-moment = Moment(app)
-migrate.init_app(app, db)
+class Routes:
+  # Collects the views below so that create_app() can add them to each app
+  # it builds, under their plain endpoint names (a Blueprint would prefix
+  # them and every url_for with it)
+  def __init__(self):
+    self.rules = []
+    self.error_handlers = []
+
+  def route(self, rule, debug=False, **options):
+    # debug routes are only added in debug mode or with DEBUG_ENDPOINTS
+    def decorator(view):
+      self.rules.append((rule, view, debug, options))
+      return view
+    return decorator
+
+  def errorhandler(self, code):
+    def decorator(handler):
+      self.error_handlers.append((code, handler))
+      return handler
+    return decorator
+
+  def init_app(self, app):
+    debug = app.debug or app.config.get('DEBUG_ENDPOINTS', False)
+    for rule, view, debug_only, options in self.rules:
+      if debug or not debug_only:
+        app.add_url_rule(rule, view_func=view, **options)
+    for code, handler in self.error_handlers:
+      app.register_error_handler(code, handler)
+
+routes = Routes()
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale='en'):
+  # Parsing the pattern and loading the locale is the expensive part of
+  # babel.dates.format_datetime, so it is done once per format
+  import babel.dates
   if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
+      format="EEEE MMMM, d, y 'at' h:mma 'UTC'"
   elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+      format="EE MM, dd, y h:mma 'UTC'"
+  return babel.dates.parse_pattern(format), babel.Locale.parse(locale)
+
+@lru_cache(maxsize=4096)
+def format_datetime(value, format='medium'):
+  # Views pass datetimes; strings are still accepted for older callers.
+  # babel and dateutil are imported on first use, not at worker start.
+  # Times are stored and shown in UTC, and labelled so.
+  if isinstance(value, str):
+    import dateutil.parser
+    value = dateutil.parser.parse(value)
+  if format in ('short', 'long'):
+    # Locale-defined formats that combine separate date and time patterns;
+    # long ends in the zone already
+    import babel.dates
+    text = babel.dates.format_datetime(value, format, tzinfo=babel.dates.UTC, locale='en')
+    return text + ' UTC' if format == 'short' else text
+  pattern, locale = datetime_pattern(format)
+  return pattern.apply(value, locale)
+
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
 
-app.jinja_env.filters['datetime'] = format_datetime
+def page_args():
+  per_page = request.args.get('per_page', current_app.config['PER_PAGE'], type=int)
+  return {
+    'per_page': min(max(per_page, 1), current_app.config['MAX_PER_PAGE']),
+    'after': request.args.get('after'),
+    'before': request.args.get('before')
+  }
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@routes.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -51,78 +117,84 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@routes.route('/venues')
+@conditional(VenueArea.version)
+@cache.cached('venues')
 def venues():
   data = []
-  city_state_for_venue = ''
+  page = {}
   error = False
   try:
-    venues = Venue.query.group_by(Venue.id, Venue.state, Venue.city).all()
-    for venue in venues:
-      if venue.city + venue.state == city_state_for_venue:
-        data[len(data) - 1]['venues'].append({
-          "id": venue.id,
-          "name": venue.name,
-        })
-      else:
-        city_state_for_venue = venue.city + venue.state
-        data.append({
-          "city": venue.city,
-          "state": venue.state,
-          "venues": [{
-            "id": venue.id,
-            "name": venue.name,
-          }]
-        })
-  except:
+    # Reads one page of the venue_areas summary, whatever the number of venues
+    page = keyset_page(
+      areas.page_query(request.args.get('genre')), [VenueArea.state, VenueArea.city],
+      lambda area: [area.state, area.city], **page_args())
+    if page['items']:
+      first, last = page['items'][0], page['items'][-1]
+      genres = areas.top_genres((first.state, first.city), (last.state, last.city))
+    for area in page['items']:
+      data.append({
+        "city": area.city,
+        "state": area.state,
+        "num_venues": area.venue_count,
+        "num_upcoming_shows": area.upcoming_show_count,
+        "next_show_at": area.next_show_at,
+        "genres": genres.get((area.state, area.city), [])
+      })
+  except Exception:
     error = True
     flash('An error occured getting list of venues')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not list venues')
   finally:
     if error:
       return redirect(url_for('index'))
     else:
-      return render_template('pages/venues.html', areas=data)
-
-@app.route('/venues/search', methods=['POST'])
+      return render_template('pages/venues.html', areas=data, page=page)
+
+@routes.route('/venues/<state>/<city>')
+@conditional(Venue.area_version)
+@cache.cached('venues', 'shows')
+def venues_in_area(state, city):
+  area = VenueArea.query.get((state, city))
+  if area is None:
+    abort(404)
+  page = keyset_page(
+    Venue.in_area(state, city, request.args.get('genre')), [Venue.name, Venue.id],
+    lambda venue: [venue.name, venue.id], **page_args())
+  genres = VenueAreaGenre.query.filter_by(state=state, city=city) \
+    .order_by(VenueAreaGenre.venue_count.desc(), VenueAreaGenre.genre).all()
+  return render_template('pages/venues_area.html', area=area, venues=page['items'], page=page,
+    genres=genres, shows=Show.upcoming_in_area(state, city, current_app.config['SHOWS_PER_SECTION']))
+
+@routes.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-  search_term = request.form.get('search_term', '')
+  search_term = request.values.get('search_term', '')
+  city = request.values.get('city', '')
+  state = request.values.get('state', '')
   response = {}
   try:
-    search_results = db.session.query(Venue).filter(Venue.name.ilike(f'%{search_term}%')).all()
-    data = [
-        {
-          "id": search.id,
-          "name": search.name,
-        } for search in search_results]
-    response = {
-      "count": len(data),
-      "data": data
-    }
-  except:
+    response = search(Venue, search_term, city=city, state=state,
+      page=request.values.get('page', 1, type=int), per_page=current_app.config['PER_PAGE'])
+  except Exception:
     response = {}
-    print(sys.exc_info())
+    current_app.logger.exception('Venue search failed')
   finally:
-    db.session.close()
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term, city=city, state=state)
 
-@app.route('/venues/<int:venue_id>')
+@routes.route('/venues/<int:venue_id>')
+@conditional(Venue.page_version)
+@cache.cached('venue:{venue_id}')
 def show_venue(venue_id):
   error = False
   data = {}
   try:
     error = False
     query = Venue.query.get(venue_id)
-    data = Venue.details_for_venue_page(query)
-    if data['all_shows'] is not []:
-      data['past_shows'] = list(filter(filter_past_shows, data['all_shows']))
-      data['past_shows_count'] = len(data['past_shows'])
-      data['upcoming_shows'] = list(filter(filter_upcoming_shows, data['all_shows']))
-      data['upcoming_shows_count'] = len(data['upcoming_shows'])
-  except:
+    data = Venue.details_for_venue_page(query, current_app.config['SHOWS_PER_SECTION'])
+  except Exception:
     error = True
     flash(message='An error occured getting venue details', category='warning')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not load venue')
   finally:
     if error:
       return redirect(url_for('index'))
@@ -132,12 +204,12 @@ def show_venue(venue_id):
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@routes.route('/venues/create', methods=['GET'])
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@routes.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   venue_form = VenueForm(request.form)
   try:
@@ -152,35 +224,47 @@ def create_venue_submission():
       website_link=venue_form.website_link.data,
       seeking_talent=venue_form.seeking_talent.data,
       seeking_description=venue_form.seeking_description.data,
-      genres=json.dumps(venue_form.genres.data)
+      genres=venue_form.genres.data
     )
     db.session.add(venue)
+    db.session.flush()
+    areas.refresh([(venue.state, venue.city)])
     db.session.commit()
+    cache.invalidate('venues')
+    suggestions.put('venues', venue.id, venue.name)
+    matches.put('venues', venue)
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  except:
+  except Exception:
     db.session.rollback()
     flash('An error occurred. Venue ' + request.form['name'] + ' could not be listed.')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not create venue')
   finally:
-    db.session.close()
     return render_template('pages/home.html')
   
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@routes.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   # TODO: Complete this endpoint for taking a venue_id, and using
   # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
   try:
     venue = Venue.query.get(venue_id)
+    artist_ids = venue.artist_ids()
+    # The venue's shows go with it, and its artists' counters drop them
+    Show.query.filter_by(venue_id=venue.id).delete(synchronize_session=False)
     db.session.delete(venue)
+    db.session.flush()
+    counters.refresh(Artist, artist_ids)
+    areas.refresh([(venue.state, venue.city)])
     db.session.commit()
+    cache.invalidate('venues', 'shows', f'venue:{venue_id}', *[f'artist:{id}' for id in artist_ids])
+    suggestions.remove('venues', venue.id)
+    matches.remove('venues', venue.id)
     flash('You have successfully deleted the venue')
-  except:
+  except Exception:
     db.session.rollback()
-    print(sys.exc_info())
+    current_app.logger.exception('Could not delete venue')
     flash('An error occured trying to delete the venue')
   finally:
-    db.session.close()
     return redirect(url_for('index'))
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
@@ -188,51 +272,45 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@routes.route('/artists')
+@conditional(lambda: listing_version(Artist))
+@cache.cached('artists')
 def artists():
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  page = keyset_page(
+    Artist.with_genre(db.session.query(Artist.id, Artist.name), request.args.get('genre')),
+    [Artist.id], lambda artist: [artist.id], **page_args())
+  return render_template('pages/artists.html', artists=page['items'], page=page)
 
-@app.route('/artists/search', methods=['POST'])
+@routes.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-  search_term = request.form.get('search_term', '')
+  search_term = request.values.get('search_term', '')
+  city = request.values.get('city', '')
+  state = request.values.get('state', '')
   response = {}
   try:
-    search_results = db.session.query(Artist).filter(Artist.name.ilike(f'%{search_term}%')).all()
-    data = [
-        {
-          "id": search.id,
-          "name": search.name,
-        } for search in search_results]
-    response = {
-      "count": len(data),
-      "data": data
-    }
-  except:
+    response = search(Artist, search_term, city=city, state=state,
+      page=request.values.get('page', 1, type=int), per_page=current_app.config['PER_PAGE'])
+  except Exception:
     response = {}
-    print(sys.exc_info())
+    current_app.logger.exception('Artist search failed')
   finally:
-    db.session.close()
-    return render_template('pages/search_artists.html', results=response, search_term=search_term)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term, city=city, state=state)
   
 
-@app.route('/artists/<int:artist_id>')
+@routes.route('/artists/<int:artist_id>')
+@conditional(Artist.page_version)
+@cache.cached('artist:{artist_id}')
 def show_artist(artist_id):
   error = False
   data = {}
   try:
     error = False
     query = Artist.query.get(artist_id)
-    data = Artist.details_for_artist_page(query)
-    if data['all_shows'] is not []:
-      data['past_shows'] = list(filter(filter_past_shows, data['all_shows']))
-      data['past_shows_count'] = len(data['past_shows'])
-      data['upcoming_shows'] = list(filter(filter_upcoming_shows, data['all_shows']))
-      data['upcoming_shows_count'] = len(data['upcoming_shows'])
-  except:
+    data = Artist.details_for_artist_page(query, current_app.config['SHOWS_PER_SECTION'])
+  except Exception:
     error = True
     flash(message='An error occured getting artist details', category='warning')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not load artist')
   finally:
     if error:
       return redirect(url_for('index'))
@@ -241,7 +319,7 @@ def show_artist(artist_id):
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@routes.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
   error = False
@@ -251,23 +329,23 @@ def edit_artist(artist_id):
     form.city.data = artist.city
     form.state.data = artist.state
     form.phone.data = artist.phone
-    form.genres.data = artist.genres
+    form.genres.data = list(artist.genres)
     form.facebook_link.data = artist.facebook_link
     form.image_link.data = artist.image_link
     form.website_link.data = artist.website_link
     form.seeking_venue.data = artist.seeking_venue
     form.seeking_description.data = artist.seeking_description
-  except:
+  except Exception:
     error = True
     flash('An error occured getting Artist details!')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not load artist for editing')
   finally:
     if error:
       return redirect(url_for('index'))
     else:
       return render_template('forms/edit_artist.html', form=form, artist=artist)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@routes.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # TODO: take values from the form submitted, and update existing
   # artist record with ID <artist_id> using the new attributes
@@ -283,18 +361,21 @@ def edit_artist_submission(artist_id):
     artist.website_link=artist_form.website_link.data
     artist.seeking_venue=artist_form.seeking_venue.data
     artist.seeking_description=artist_form.seeking_description.data
-    artist.genres=json.dumps(artist_form.genres.data)
+    artist.genres=artist_form.genres.data
+    artist.updated_at=datetime.utcnow()
     db.session.commit()
+    cache.invalidate('artists', 'shows', f'artist:{artist_id}', *[f'venue:{id}' for id in artist.venue_ids()])
+    suggestions.put('artists', artist.id, artist.name)
+    matches.put('artists', artist)
     flash('Artist ' + request.form['name'] + ' was successfully edited!')
-  except:
+  except Exception:
     db.session.rollback()
     flash('An error occurred. Artist ' + request.form['name'] + ' could not be edited.')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not edit artist')
   finally:
-    db.session.close()
     return redirect(url_for('show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@routes.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
   error = False
@@ -305,16 +386,16 @@ def edit_venue(venue_id):
     form.state.data = venue.state
     form.address.data = venue.address
     form.phone.data = venue.phone
-    form.genres.data = venue.genres
+    form.genres.data = list(venue.genres)
     form.facebook_link.data = venue.facebook_link
     form.image_link.data = venue.image_link
     form.website_link.data = venue.website_link
     form.seeking_talent.data = venue.seeking_talent
     form.seeking_description.data = venue.seeking_description
-  except:
+  except Exception:
     error = True 
     flash('An error occured getting Venue details!')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not load venue for editing')
   finally:
     if error:
       return redirect(url_for('index'))
@@ -322,13 +403,14 @@ def edit_venue(venue_id):
       return render_template('forms/edit_venue.html', form=form, venue=venue)
   
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@routes.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   # TODO: take values from the form submitted, and update existing
   # venue record with ID <venue_id> using the new attributes
   venue_form = VenueForm(request.form)
   try:
     venue = Venue.query.get(venue_id)
+    old_area = (venue.state, venue.city)
     venue.name=venue_form.name.data
     venue.city=venue_form.city.data
     venue.state=venue_form.state.data
@@ -339,26 +421,31 @@ def edit_venue_submission(venue_id):
     venue.website_link=venue_form.website_link.data
     venue.seeking_talent=venue_form.seeking_talent.data
     venue.seeking_description=venue_form.seeking_description.data
-    venue.genres=json.dumps(venue_form.genres.data)
+    venue.genres=venue_form.genres.data
+    venue.updated_at=datetime.utcnow()
+    db.session.flush()
+    areas.refresh([old_area, (venue.state, venue.city)])
     db.session.commit()
+    cache.invalidate('venues', 'shows', f'venue:{venue_id}', *[f'artist:{id}' for id in venue.artist_ids()])
+    suggestions.put('venues', venue.id, venue.name)
+    matches.put('venues', venue)
     flash('Venue ' + request.form['name'] + ' was successfully edited!')
-  except:
+  except Exception:
     db.session.rollback()
     flash('An error occurred. Venue ' + request.form['name'] + ' could not be edited.')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not edit venue')
   finally:
-    db.session.close()
     return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@routes.route('/artists/create', methods=['GET'])
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@routes.route('/artists/create', methods=['POST'])
 def create_artist_submission():
   artist_form = ArtistForm(request.form)
   try:
@@ -368,7 +455,7 @@ def create_artist_submission():
       state=artist_form.state.data,
       phone=artist_form.phone.data,
       image_link=artist_form.image_link.data,
-      genres=json.dumps(artist_form.genres.data),
+      genres=artist_form.genres.data,
       facebook_link=artist_form.facebook_link.data,
       website_link=artist_form.website_link.data,
       seeking_venue=artist_form.seeking_venue.data,
@@ -376,13 +463,15 @@ def create_artist_submission():
     )
     db.session.add(artist)
     db.session.commit()
+    cache.invalidate('artists')
+    suggestions.put('artists', artist.id, artist.name)
+    matches.put('artists', artist)
     flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  except:
+  except Exception:
     db.session.rollback()
     flash('An error occurred. Artist ' + request.form['name'] + ' could not be listed.')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not create artist')
   finally:
-    db.session.close()
     return render_template('pages/home.html')
 
 
@@ -390,76 +479,237 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@routes.route('/shows')
+@conditional(lambda: listing_version(Show, Venue, Artist))
+@cache.cached('shows')
 def shows():
   data = []
+  page = {}
   error = False
   try:
-    shows = db.session.query(Show).join(Artist).join(Venue).all()
-    for show in shows: 
+    page = keyset_page(
+      db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.updated_at,
+        Venue.name.label('venue_name'), Venue.updated_at.label('venue_updated_at'),
+        Artist.name.label('artist_name'), Artist.image_link, Artist.updated_at.label('artist_updated_at'))
+        .join(Artist, Show.artist_id == Artist.id)
+        .join(Venue, Show.venue_id == Venue.id),
+      [Show.start_time, Show.id], lambda show: [show.start_time, show.id], **page_args())
+    for show in page['items']:
       data.append({
+        "id": show.id,
+        "updated_at": show.updated_at,
         "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
+        "venue_name": show.venue_name,
         "artist_id": show.artist_id,
-        "artist_name": show.artist.name, 
-        "artist_image_link": show.artist.image_link,
-        "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S') 
+        "artist_name": show.artist_name,
+        "artist_image_link": show.image_link,
+        "start_time": show.start_time,
+        "venue_updated_at": show.venue_updated_at,
+        "artist_updated_at": show.artist_updated_at
       })
     error = False 
-  except:
+  except Exception:
     error = True
     flash(message='An error occured getting show details', category='warning')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not list shows')
   finally:
     if error:
       return redirect(url_for('index'))
     else:
-      return render_template('pages/shows.html', shows=data)
+      return render_template('pages/shows.html', shows=data, page=page)
   
-@app.route('/shows/create')
+@routes.route('/shows/create')
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
+  suggestions.warm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@routes.route('/shows/create', methods=['POST'])
 def create_show_submission():
   show_form = ShowForm(request.form)
   try:
-    show = Show(
-      venue_id=show_form.venue_id.data,
-      artist_id=show_form.artist_id.data,
-      start_time=show_form.start_time.data
-    )
-    db.session.add(show)
+    shows = book([{
+      'venue_id': show_form.venue_id.data,
+      'artist_id': show_form.artist_id.data,
+      'start_time': show_form.start_time.data
+    }])
     db.session.commit()
+    invalidate_shows(shows)
     flash('Show was successfully listed!')
-  except:
+  except BookingError as e:
+    db.session.rollback()
+    flash('Show could not be listed. ' + str(e))
+  except IntegrityError:
+    # The exclusion constraint caught a booking made at the same moment
+    db.session.rollback()
+    flash('Show could not be listed. The venue or artist was just booked for that time.')
+  except Exception:
     db.session.rollback()
     flash('An error occurred. Show could not be listed.')
-    print(sys.exc_info())
+    current_app.logger.exception('Could not create show')
   finally:
-    db.session.close()
     return render_template('pages/home.html')
 
-@app.errorhandler(404)
+def invalidate_shows(shows):
+  cache.invalidate('shows', 'venues',
+    *{f'venue:{show.venue_id}' for show in shows}, *{f'artist:{show.artist_id}' for show in shows})
+
+#  API
+#  ----------------------------------------------------------------
+
+@routes.route('/api/v1/<any(venues, artists, shows):kind>')
+def api_export(kind):
+  format = request.args.get('format', 'ndjson')
+  if format not in ('ndjson', 'csv'):
+    return jsonify({'error': 'format must be ndjson or csv'}), 400
+  try:
+    rows = stream(kind, format, request.args.get('fields'), request.args.get('genre'))
+  except ValueError as e:
+    return jsonify({'error': str(e)}), 400
+  mimetype = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+  return Response(stream_with_context(rows), mimetype=mimetype)
+
+@routes.route('/api/v1/suggest/<any(venues, artists):kind>')
+def api_suggest(kind):
+  # Names starting with q, for the show form's typeahead
+  limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+  return jsonify({'suggestions': suggestions.search(kind, request.args.get('q', ''), limit)})
+
+@routes.route('/api/v1/<any(venues, artists):kind>/<int:id>/matches')
+def api_matches(kind, id):
+  # Seeking artists suggested for a venue, or seeking venues for an artist,
+  # leaving out those it already has shows with. Loaded by the detail pages
+  # after they render, so their cached copies do not go stale with them.
+  subject = (Venue if kind == 'venues' else Artist).query.get(id)
+  if subject is None:
+    return jsonify({'error': f'no such {kind[:-1]}'}), 404
+  limit = min(max(request.args.get('limit', 6, type=int), 1), 50)
+  if kind == 'venues':
+    results = matches.search('artists', subject, limit, exclude=subject.artist_ids())
+  else:
+    results = matches.search('venues', subject, limit, exclude=subject.venue_ids())
+  return jsonify({'matches': results})
+
+@routes.route('/api/v1/shows', methods=['POST'])
+def api_book_shows():
+  # Books a JSON list of {venue_id, artist_id, start_time} in one
+  # transaction: either every show is created or none is
+  bookings = request.get_json(silent=True)
+  if isinstance(bookings, dict):
+    bookings = bookings.get('shows')
+  if not isinstance(bookings, list) or not all(isinstance(booking, dict) for booking in bookings):
+    return jsonify({'error': 'expected a list of shows'}), 400
+  bookings = [{
+    'venue_id': json_id(booking.get('venue_id')),
+    'artist_id': json_id(booking.get('artist_id')),
+    'start_time': parse_start_time(booking.get('start_time'))
+  } for booking in bookings]
+  # Missing or malformed fields are 400, ids of no venue or artist 422 and
+  # only slots already taken 409
+  malformed = [{key: [message] for key, message in (('venue_id', 'Must be an integer id.'),
+    ('artist_id', 'Must be an integer id.'), ('start_time', 'Must be an ISO 8601 date and time.'))
+    if booking[key] is None} for booking in bookings]
+  if any(malformed):
+    return booking_errors(malformed), 400
+  try:
+    shows = book(bookings)
+    db.session.commit()
+  except BookingError as e:
+    db.session.rollback()
+    return booking_errors(e.errors), 409 if e.clash else 422
+  except IntegrityError:
+    db.session.rollback()
+    return jsonify({'error': 'a venue or artist was booked for an overlapping time meanwhile'}), 409
+  invalidate_shows(shows)
+  return jsonify({'shows': [{
+    'id': show.id,
+    'venue_id': show.venue_id,
+    'artist_id': show.artist_id,
+    'start_time': show.start_time.isoformat()
+  } for show in shows]}), 201
+
+def booking_errors(errors):
+  return jsonify({'errors': [{'index': i, 'errors': errors}
+    for i, errors in enumerate(errors) if errors]})
+
+def json_id(value):
+  # JSON true and false arrive as bools, which are ints to isinstance
+  return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+def parse_start_time(value):
+  # ISO 8601. Start times are stored as naive UTC, and a time without an
+  # offset is taken to be UTC already, as in the show form and the importer.
+  try:
+    value = datetime.fromisoformat(value)
+  except (TypeError, ValueError):
+    return None
+  return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo is not None else value
+
+@routes.route('/_cache', debug=True)
+def cache_stats():
+  return jsonify(dict(cache.stats(), fragments=fragments.stats()))
+
+@routes.route('/_pool', debug=True)
+def pool_stats():
+  return jsonify(db.pool_status())
+
+@routes.route('/_logs', debug=True)
+def recent_logs():
+  # The newest records this worker logged, e.g. ?level=ERROR&limit=20
+  level = logging.getLevelName(request.args.get('level', 'NOTSET').upper())
+  if not isinstance(level, int):
+    return jsonify({'error': 'unknown level'}), 400
+  return jsonify(logs.stats(level, request.args.get('limit', 100, type=int)))
+
+@routes.route('/_metrics', debug=True)
+def prometheus_metrics():
+  return Response(instrumentation.render(pool=db.pool_status(), cache=cache.stats(),
+    fragment_cache=fragments.stats()),
+    mimetype='text/plain; version=0.0.4')
+
+@routes.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@routes.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Application factory.
+#----------------------------------------------------------------------------#
+
+def create_app(config='config', migrate=False, **settings):
+  app = Flask(__name__)
+  app.config.from_object(config)
+  app.config.update(settings)
+  if app.config.get('TEMPLATE_CACHE_DIR'):
+    # Compiled templates, filled by `flask assets build` or on first render
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    app.jinja_options = dict(app.jinja_options,
+      bytecode_cache=FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR']))
+  db.init_app(app)
+  # Only the app `flask db` runs against sets up migrations, see the README;
+  # the web workers skip the alembic import, about a quarter of their startup
+  if migrate:
+    from flask_migrate import Migrate
+    Migrate(app, db)
+  cache.init_app(app)
+  fragments.init_app(app)
+  assets.init_app(app)
+  suggestions.init_app(app)
+  matches.init_app(app)
+  logs.init_app(app)
+  instrumentation.init_app(app)
+  routes.init_app(app)
+  app.jinja_env.filters['datetime'] = format_datetime
+  app.cli.add_command(import_command)
+  app.cli.add_command(export_command)
+  app.cli.add_command(counters.roll_forward_command)
+  app.cli.add_command(assets_command)
+  return app
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -467,11 +717,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
@@ -0,0 +1,77 @@
+from datetime import datetime
+from sqlalchemy import func, tuple_
+from models import db, Venue, VenueGenre, VenueArea, VenueAreaGenre
+
+# Maintains the venue_areas and venue_area_genres summary tables. Every write
+# that changes a venue's area, genres or show counters calls refresh() with
+# the areas it touched; each area is recomputed from its own venues through
+# ix_Venue_state_city, so the cost depends on the area, not the catalogue.
+# Show counter changes pass genres=False, as bookings leave the genre facets
+# as they were.
+
+TOP_GENRES = 5
+
+def of_venues(venue_ids):
+    # The (state, city) areas of some venues
+    if not venue_ids:
+        return set()
+    return {(state, city) for state, city in
+        db.session.query(Venue.state, Venue.city).filter(Venue.id.in_(set(venue_ids))).distinct()}
+
+def refresh(areas, genres=True):
+    for state, city in set(areas):
+        in_area = (Venue.state == state, Venue.city == city)
+        venue_count, upcoming, next_show_at = db.session.query(
+            func.count(Venue.id), func.coalesce(func.sum(Venue.upcoming_show_count), 0),
+            func.min(Venue.next_show_at)).filter(*in_area).one()
+        if genres or not venue_count:
+            VenueAreaGenre.query.filter_by(state=state, city=city).delete(synchronize_session=False)
+        area = VenueArea.query.get((state, city))
+        if not venue_count:
+            if area is not None:
+                db.session.delete(area)
+            continue
+        if area is None:
+            area = VenueArea(state=state, city=city)
+            db.session.add(area)
+        area.venue_count = venue_count
+        area.upcoming_show_count = upcoming
+        area.next_show_at = next_show_at
+        # Stamped even when the numbers are unchanged, since the genre
+        # facets may not be; /venues takes its ETag from it
+        area.updated_at = datetime.utcnow()
+        if genres:
+            facets = db.session.query(VenueGenre.genre, func.count(Venue.id)) \
+                .join(Venue, VenueGenre.venue_id == Venue.id).filter(*in_area).group_by(VenueGenre.genre)
+            db.session.add_all(VenueAreaGenre(state=state, city=city, genre=genre, venue_count=count)
+                for genre, count in facets)
+    db.session.flush()
+
+def rebuild():
+    VenueAreaGenre.query.delete(synchronize_session=False)
+    VenueArea.query.delete(synchronize_session=False)
+    refresh(db.session.query(Venue.state, Venue.city).distinct().all())
+
+def page_query(genre=None):
+    # Areas for the /venues listing; with genre, only areas playing it, with
+    # the number of their venues that do
+    if not genre:
+        return db.session.query(VenueArea.state, VenueArea.city, VenueArea.venue_count,
+            VenueArea.upcoming_show_count, VenueArea.next_show_at)
+    return db.session.query(VenueArea.state, VenueArea.city, VenueAreaGenre.venue_count,
+        VenueArea.upcoming_show_count, VenueArea.next_show_at) \
+        .join(VenueAreaGenre, (VenueAreaGenre.state == VenueArea.state) & (VenueAreaGenre.city == VenueArea.city)) \
+        .filter(VenueAreaGenre.genre == genre)
+
+def top_genres(first_area, last_area):
+    # (state, city) -> most played genres, for a page of areas
+    area = tuple_(VenueAreaGenre.state, VenueAreaGenre.city)
+    rows = db.session.query(VenueAreaGenre) \
+        .filter(area >= tuple_(*first_area), area <= tuple_(*last_area)) \
+        .order_by(VenueAreaGenre.venue_count.desc(), VenueAreaGenre.genre)
+    genres = {}
+    for row in rows:
+        genres.setdefault((row.state, row.city), [])
+        if len(genres[(row.state, row.city)]) < TOP_GENRES:
+            genres[(row.state, row.city)].append({'genre': row.genre, 'venue_count': row.venue_count})
+    return genres
@@ -0,0 +1,225 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# `flask assets build` writes a copy of every file in static/ under a name
+# carrying its content hash, concatenates the bundles below, and stores
+# .gz and .br variants next to the text files, all in static/build/. The
+# manifest maps logical names to the hashed ones; asset_url() and
+# bundle_urls() resolve through it, and until a build exists they return
+# the plain /static URLs. Hashed names never change content, so they are
+# served with a year's immutable caching, precompressed per Accept-Encoding.
+
+BUNDLES = {
+    'main.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+        'css/main.responsive.css', 'css/main.quickfix.css'],
+    'head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'main.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.eot', '.ttf', '.otf'}
+MAX_AGE = 365 * 24 * 60 * 60
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+CSS_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*(!?).*?\*/', re.S)
+SOURCE_MAP = re.compile(r'^\s*(//[#@] sourceMappingURL=.*|/\*[#@] sourceMappingURL=.*\*/)\s*$', re.M)
+
+def fingerprint(name, data):
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+def rewrite_css_urls(text, path, manifest, static_url_path):
+    # Relative url()s would break once the file moves, so they become
+    # absolute, pointing at the hashed copy when there is one
+    def replace(match):
+        quote, target = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', target):
+            return match.group(0)
+        target, _, suffix = target.partition('?')
+        target, hash_sep, fragment = target.partition('#')
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(path), target))
+        if resolved in manifest:
+            url = f'{static_url_path}/{BUILD_DIR}/{manifest[resolved]}'
+        else:
+            url = f'{static_url_path}/{resolved}'
+        url += ('?' + suffix if suffix else '') + (hash_sep + fragment)
+        return f'url({quote}{url}{quote})'
+    return CSS_URL.sub(replace, text)
+
+def minify_css(text):
+    # Drops comments (keeping /*! licences) and redundant whitespace outside
+    # strings; conservative enough to leave selectors alone
+    parts = []
+    def keep(match):
+        if match.group(1) is not None or match.group(2):
+            parts.append(match.group(0))
+            return f'\0{len(parts) - 1}\0'
+        return ''
+    text = CSS_STRING_OR_COMMENT.sub(keep, text)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text).replace(';}', '}')
+    return re.sub(r'\0(\d+)\0', lambda match: parts[int(match.group(1))], text).strip()
+
+def write(directory, name, data):
+    # Hashed names are immutable, so files an earlier build wrote are kept
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variants = [('', data)]
+    if os.path.splitext(name)[1] in COMPRESSIBLE:
+        variants.append(('.gz', gzip.compress(data, 9, mtime=0)))
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data)))
+    for suffix, content in variants:
+        if suffix and len(content) >= len(data):
+            continue
+        with open(path + suffix, 'wb') as f:
+            f.write(content)
+
+def build(static_folder, static_url_path, clean=False):
+    out = os.path.join(static_folder, BUILD_DIR)
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if not (root == static_folder and d == BUILD_DIR))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                sources.append(os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/'))
+
+    manifest = {}
+    def read(path):
+        with open(os.path.join(static_folder, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css_urls(data.decode('utf-8'), path, manifest, static_url_path).encode('utf-8')
+        return data
+    # CSS last, so its url()s can point at the hashed fonts and images
+    for path in sorted(sources, key=lambda path: path.endswith('.css')):
+        data = read(path)
+        manifest[path] = fingerprint(path, data)
+        write(out, manifest[path], data)
+    for name, paths in BUNDLES.items():
+        if name.endswith('.css'):
+            data = '\n'.join(minify_css(read(path).decode('utf-8')) for path in paths).encode('utf-8')
+        else:
+            # Scripts are concatenated as they are; the libraries ship minified
+            data = b';\n'.join(SOURCE_MAP.sub('', read(path).decode('utf-8')).encode('utf-8') for path in paths)
+        manifest[name] = fingerprint(name, data)
+        write(out, manifest[name], data)
+
+    fd, tmp = tempfile.mkstemp(dir=out)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(out, MANIFEST))
+
+    removed = 0
+    if clean:
+        current = set(manifest.values()) | {MANIFEST}
+        for root, _, files in os.walk(out):
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), out).replace(os.sep, '/')
+                if path.endswith(('.gz', '.br')):
+                    path = path[:-3]
+                if path not in current:
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+    return manifest, removed
+
+def compile_templates(app):
+    # Loading each template once stores its compiled code in the bytecode
+    # cache, so workers started later skip the parse
+    env = app.jinja_env
+    if env.bytecode_cache is None:
+        return 0
+    names = env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+class Assets:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        app.extensions['assets'] = manifest
+        app.add_url_rule(f'{app.static_url_path}/{BUILD_DIR}/<path:filename>', 'built_asset', self.send)
+        app.jinja_env.globals.update(asset_url=self.url, bundle_urls=self.bundle_urls)
+
+    @property
+    def manifest(self):
+        # The current app's, read from its static folder at setup
+        return current_app.extensions.get('assets', {})
+
+    def url(self, path):
+        manifest = self.manifest
+        if path in manifest:
+            return url_for('built_asset', filename=manifest[path])
+        return url_for('static', filename=path)
+
+    def bundle_urls(self, name):
+        if name in self.manifest:
+            return [self.url(name)]
+        return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+    def send(self, filename):
+        directory = os.path.join(current_app.static_folder, BUILD_DIR)
+        path, encoding = filename, None
+        for name, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings[name] and os.path.isfile(os.path.join(directory, filename + suffix)):
+                path, encoding = filename + suffix, name
+                break
+        response = send_from_directory(directory, path, mimetype=mimetypes.guess_type(filename)[0],
+            max_age=MAX_AGE)
+        if encoding:
+            response.content_encoding = encoding
+            del response.headers['Content-Disposition']
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+@click.group('assets')
+def assets_command():
+    """Build fingerprinted static assets."""
+
+
+@assets_command.command('build')
+@click.option('--clean', is_flag=True, help='Delete files of earlier builds the new manifest no longer names.')
+@with_appcontext
+def build_command(clean):
+    """Hash, bundle and precompress static/ and compile the templates."""
+    manifest, removed = build(current_app.static_folder, current_app.static_url_path, clean)
+    click.echo(f'Wrote {len(manifest)} assets to {os.path.join(current_app.static_folder, BUILD_DIR)}'
+        + (f', removed {removed} old files' if clean else ''))
+    compiled = compile_templates(current_app)
+    if compiled:
+        click.echo(f'Compiled {compiled} templates to {current_app.config["TEMPLATE_CACHE_DIR"]}')
+    if brotli is None:
+        click.echo('brotli is not installed; only .gz variants were written')
+    click.echo('Restart the app to serve the new manifest')
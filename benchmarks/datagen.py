@@ -0,0 +1,129 @@
+"""Seeded synthetic catalogue of venues, artists and shows.
+
+Usage: python benchmarks/datagen.py --shows 100000 [--venues N] [--artists N]
+           [--skew 1.1] [--seed 1] [--database-url URL]
+
+The same arguments always produce the same rows. Shows per venue follow a
+Zipf distribution (--skew 0 spreads them evenly), half of them in the past.
+Start times are laid out so no venue or artist is double booked, which the
+Postgres exclusion constraints would reject. Without --database-url the
+configured database is used; its tables are dropped and recreated.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from forms import GENRES, STATES
+from models import db, Venue, Artist, Show, VenueGenre, ArtistGenre
+import counters
+
+WORDS = ['Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live', 'Music',
+    'Coffee', 'Jazz', 'Club', 'Hall', 'Room', 'Garden', 'Lounge', 'Tavern', 'Stage', 'House']
+BATCH = 10000
+# A venue or artist plays at most one show in each of these offsets per day,
+# SHOW_LENGTH apart
+SLOTS_PER_DAY = 8
+
+def scale(shows, venues=None, artists=None):
+    # Default entity counts for a number of shows
+    venues = venues or max(shows // 20, 10)
+    artists = max(artists or shows // 10, -(-venues // SLOTS_PER_DAY), 10)
+    return venues, artists
+
+def shows_per_venue(shows, venues, skew, rng):
+    # Zipf weights over a shuffled venue order, rounded to sum to shows
+    weights = [1 / (rank ** skew) for rank in range(1, venues + 1)]
+    total = sum(weights)
+    counts = [int(shows * weight / total) for weight in weights]
+    for i in range(shows - sum(counts)):
+        counts[i % venues] += 1
+    rng.shuffle(counts)
+    return counts
+
+def insert(table, rows):
+    for start in range(0, len(rows), BATCH):
+        db.session.execute(table.insert(), rows[start:start + BATCH])
+
+def generate(shows, venues=None, artists=None, skew=1.1, seed=1):
+    rng = random.Random(seed)
+    venues, artists = scale(shows, venues, artists)
+    cities = [(rng.choice(STATES), f'City {i}') for i in range(max(venues // 25, 1))]
+    now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+
+    venue_rows, venue_genres = [], []
+    for id in range(1, venues + 1):
+        state, city = rng.choice(cities)
+        venue_rows.append({
+            'id': id, 'name': ' '.join(rng.sample(WORDS, 3)) + f' {id}', 'city': city, 'state': state,
+            'address': f'{id} Main St', 'phone': '123-123-1234', 'seeking_talent': rng.random() < 0.3,
+            'image_link': f'https://example.com/venues/{id}.jpg'})
+        venue_genres.extend({'venue_id': id, 'genre': genre} for genre in rng.sample(GENRES, rng.randint(1, 3)))
+    artist_rows, artist_genres = [], []
+    for id in range(1, artists + 1):
+        state, city = rng.choice(cities)
+        artist_rows.append({
+            'id': id, 'name': f'{rng.choice(WORDS)} {rng.choice(WORDS)} Band {id}', 'city': city, 'state': state,
+            'phone': '123-123-1234', 'seeking_venue': rng.random() < 0.3,
+            'image_link': f'https://example.com/artists/{id}.jpg'})
+        artist_genres.extend({'artist_id': id, 'genre': genre} for genre in rng.sample(GENRES, rng.randint(1, 3)))
+
+    # The k-th show of venue v is on day k at slot v // artists, played by
+    # artist (v + k) % artists. Two shows of one artist on the same day then
+    # come from venues in different slots, so nobody is double booked.
+    counts = shows_per_venue(shows, venues, skew, rng)
+    first_day = now - timedelta(days=max(counts) // 2)
+    slot = timedelta(hours=24 // SLOTS_PER_DAY)
+    show_rows = []
+    for v, count in enumerate(counts):
+        start = first_day + (v // artists) * slot
+        for k in range(count):
+            show_rows.append({'venue_id': v + 1, 'artist_id': (v + k) % artists + 1,
+                'start_time': start + timedelta(days=k)})
+
+    insert(Venue.__table__, venue_rows)
+    insert(VenueGenre.__table__, venue_genres)
+    insert(Artist.__table__, artist_rows)
+    insert(ArtistGenre.__table__, artist_genres)
+    insert(Show.__table__, show_rows)
+    counters.refresh_all()
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        # Explicit ids leave the sequences behind
+        for table in ('Venue', 'Artist'):
+            db.session.execute(f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f'(SELECT max(id) FROM "{table}"))')
+        db.session.commit()
+    return {'venues': venues, 'artists': artists, 'shows': shows, 'skew': skew, 'seed': seed,
+        'max_shows_per_venue': max(counts)}
+
+def reset():
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--venues', type=int)
+    parser.add_argument('--artists', type=int)
+    parser.add_argument('--skew', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    app = create_app()
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    with app.app_context():
+        reset()
+        started = time.perf_counter()
+        summary = generate(args.shows, args.venues, args.artists, args.skew, args.seed)
+        print(f'{summary} in {time.perf_counter() - started:.1f}s')
+
+if __name__ == '__main__':
+    main()
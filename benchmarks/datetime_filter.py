@@ -0,0 +1,61 @@
+"""Compares the datetime Jinja filter with the implementation it replaced.
+
+Usage: python benchmarks/datetime_filter.py [--shows 300] [--repeat 20]
+
+Formats one page worth of show start times the way show_venue.html does,
+first with the old strftime -> dateutil.parser.parse -> format_datetime
+round trip and then with the current filter, cold (first page view) and warm.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime
+
+def old_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+def page(start_times, repeat, render):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for start_time in start_times:
+            render(start_time)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start_times = [datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=rng.randrange(10 ** 6))
+        for _ in range(args.shows)]
+
+    old = page(start_times, args.repeat,
+        lambda value: old_format_datetime(value.strftime('%m/%d/%Y, %H:%M:%S'), 'full'))
+    format_datetime.cache_clear()
+    cold = page(start_times, 1, lambda value: format_datetime(value, 'full'))
+    warm = page(start_times, args.repeat, lambda value: format_datetime(value, 'full'))
+    print(f'{args.shows} start times per page')
+    print(f'old filter          {old:8.2f} ms')
+    print(f'new filter, cold    {cold:8.2f} ms  ({old / cold:.1f}x)')
+    print(f'new filter, cached  {warm:8.2f} ms  ({old / warm:.1f}x)')
+
+if __name__ == '__main__':
+    main()
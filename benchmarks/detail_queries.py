@@ -0,0 +1,107 @@
+"""Checks that the venue and artist detail pages issue a fixed number of queries.
+
+Usage: python benchmarks/detail_queries.py [--shows 5 200] [--database-url URL]
+
+For each show count, seeds one venue and one artist, each with that many
+past and upcoming shows against distinct artists and venues, then counts
+the statements Venue.details_for_venue_page and
+Artist.details_for_artist_page issue, and those of a GET of each page with
+the page cache off. Loading a show's artist or venue lazily would add a
+query per show. Exits with status 1 unless every count is the same at each
+show count. Without --database-url a fresh SQLite file is used.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from cache import cache
+from models import db, Venue, Artist, Show
+
+app = create_app()
+
+def seed(shows):
+    # Venue 1 and artist 1 get the shows; the others each appear in one
+    now = datetime.utcnow()
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': f'Venue {i}', 'city': 'City 0', 'state': 'NY', 'address': f'{i} Main St',
+            'phone': '123-123-1234'} for i in range(shows + 1)])
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': f'Artist {i}', 'city': 'City 0', 'state': 'NY', 'phone': '123-123-1234'}
+        for i in range(shows + 1)])
+    rows = []
+    for i in range(shows):
+        start_time = now + timedelta(days=i - shows // 2)
+        rows.append({'venue_id': 1, 'artist_id': i + 2, 'start_time': start_time})
+        rows.append({'venue_id': i + 2, 'artist_id': 1, 'start_time': start_time})
+    db.session.execute(Show.__table__.insert(), rows)
+    db.session.commit()
+
+def count_statements(call):
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        call()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return len(statements)
+
+def details(model, method):
+    def call():
+        getattr(model.query.get(1), method)(app.config['SHOWS_PER_SECTION'])
+        db.session.remove()
+    return call
+
+def page(path):
+    def call():
+        response = app.test_client().get(path)
+        if response.status_code != 200:
+            sys.exit(f'{path} returned {response.status_code}')
+    return call
+
+def measure(shows):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(shows)
+        db.session.remove()
+        counts = {
+            'details_for_venue_page': count_statements(details(Venue, 'details_for_venue_page')),
+            'details_for_artist_page': count_statements(details(Artist, 'details_for_artist_page')),
+            'GET /venues/1': count_statements(page('/venues/1')),
+            'GET /artists/1': count_statements(page('/artists/1')),
+        }
+        db.session.remove()
+        db.drop_all()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, nargs='+', default=[5, 200])
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=args.database_url or 'sqlite:///' + os.path.join(directory, 'details.db'),
+        CACHE_TYPE='null')
+    cache.init_app(app)
+
+    results = {shows: measure(shows) for shows in args.shows}
+    print(f'{"queries":<26}' + ''.join(f'{f"{shows} shows":>12}' for shows in args.shows))
+    failures = 0
+    for name in results[args.shows[0]]:
+        counts = [results[shows][name] for shows in args.shows]
+        failures += len(set(counts)) > 1
+        print(f'{name:<26}' + ''.join(f'{count:>12}' for count in counts) + ('' if len(set(counts)) == 1 else '   GROWS'))
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Statements and time of `flask import shows`, which must not grow per row.
+
+Usage: python benchmarks/import_queries.py [--shows 1000 10000] [--batch-size 5000]
+           [--database-url URL]
+
+For each count, seeds 100 venues and artists, writes that many shows to an
+NDJSON file (a few of them clashing, to exercise the rejects) and imports
+it through the CLI command, counting the statements it issues. Checking
+rows one at a time costs at least two statements each; exits with status
+1 if an import issues more than one per ten rows. Without --database-url
+a fresh SQLite file is used.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app
+from cache import cache
+from models import db, Venue, Artist
+
+app = create_app()
+
+OWNERS = 100
+
+def seed():
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': f'Venue {i}', 'city': 'City 0', 'state': 'NY', 'address': f'{i} Main St',
+            'phone': '123-123-1234'} for i in range(OWNERS)])
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': f'Artist {i}', 'city': 'City 0', 'state': 'NY', 'phone': '123-123-1234'}
+        for i in range(OWNERS)])
+    db.session.commit()
+
+def write_shows(path, count):
+    # Each venue and artist plays every OWNERS-th slot, a day apart; every
+    # 100th row repeats the one before it and is rejected as a clash
+    start = datetime(2100, 1, 1)
+    with open(path, 'w') as f:
+        for i in range(count):
+            slot = i - 1 if i % 100 == 99 else i
+            f.write(json.dumps({'venue_id': slot % OWNERS + 1, 'artist_id': slot * 7 % OWNERS + 1,
+                'start_time': f'{start + timedelta(days=slot // OWNERS, hours=slot % 3 * 4):%Y-%m-%d %H:%M:%S}'}) + '\n')
+
+def measure(directory, count, batch_size):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        db.session.remove()
+    path = os.path.join(directory, f'shows-{count}.ndjson')
+    write_shows(path, count)
+    statements = []
+    record = lambda *args: statements.append(1)
+    event.listen(Engine, 'before_cursor_execute', record)
+    try:
+        started = time.perf_counter()
+        result = app.test_cli_runner().invoke(args=['import', 'shows', path, '--batch-size', str(batch_size)])
+        elapsed = time.perf_counter() - started
+    finally:
+        event.remove(Engine, 'before_cursor_execute', record)
+    if result.exit_code:
+        sys.exit(result.output + repr(result.exception))
+    with open(path + '.rejects.ndjson') as f:
+        rejected = sum(1 for _ in f)
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    return len(statements), rejected, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=args.database_url or 'sqlite:///' + os.path.join(directory, 'import.db'),
+        CACHE_TYPE='null')
+    cache.init_app(app)
+
+    print(f'{"shows":>8}{"batches":>10}{"statements":>12}{"per batch":>12}{"rejected":>10}{"rows/sec":>10}')
+    failures = 0
+    for count in args.shows:
+        statements, rejected, elapsed = measure(directory, count, args.batch_size)
+        batches = math.ceil(count / args.batch_size)
+        failures += statements > count / 10
+        print(f'{count:>8}{batches:>10}{statements:>12}{statements / batches:>12.0f}{rejected:>10}{count / elapsed:>10.0f}')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
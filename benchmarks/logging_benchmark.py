@@ -0,0 +1,98 @@
+"""Cost of logging to the request thread, with a fast and a stalled sink.
+
+Usage: python benchmarks/logging_benchmark.py [--records 2000] [--stall-ms 5]
+
+Logs --records records inside a request context, once through a
+synchronous handler like the FileHandler app.py used to attach and once
+through logs.StructuredQueueHandler, first to a plain file and then to a
+sink that sleeps --stall-ms per record, as a disk or log shipper under
+pressure would. Then logs the same error --records times, as every
+request would during a database outage, and counts what gets written.
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from logs import JsonFormatter, Logs
+
+class StalledHandler(logging.FileHandler):
+    def __init__(self, filename, stall):
+        super().__init__(filename)
+        self.stall = stall
+
+    def emit(self, record):
+        time.sleep(self.stall)
+        super().emit(record)
+
+def app_with(sink, queued):
+    app = Flask('bench')
+    logger = logging.getLogger('bench')
+    logger.handlers.clear()
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    sink.setFormatter(JsonFormatter() if queued else
+        logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+    if queued:
+        Logs().init_app(app)
+        logs = app.extensions['logs']
+        logs.sinks = [sink]
+        return app, logs
+    logger.addHandler(sink)
+    return app, None
+
+def time_records(app, records, error=False):
+    samples = []
+    with app.test_request_context('/venues/1'):
+        for i in range(records):
+            start = time.perf_counter()
+            if error:
+                try:
+                    raise ConnectionError('could not connect to server')
+                except ConnectionError:
+                    app.logger.exception('Could not load venue')
+            else:
+                app.logger.info('Venue %d loaded', i)
+            samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99)], sum(samples) / 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--stall-ms', type=float, default=5)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+
+    print(f'{"":<28}{"p50 us":>10}{"p99 us":>10}{"total s":>10}')
+    for sink_name in ('file', 'stalled file'):
+        for queued in (False, True):
+            path = os.path.join(directory, f'{sink_name}-{queued}.log')
+            sink = StalledHandler(path, args.stall_ms / 1000) if sink_name == 'stalled file' else logging.FileHandler(path)
+            app, logs = app_with(sink, queued)
+            p50, p99, total = time_records(app, args.records)
+            if logs:
+                dropped = logs.dropped
+                logs.stop()
+            label = f'{sink_name}, {"queued" if queued else "synchronous"}'
+            print(f'{label:<28}{p50:>10.1f}{p99:>10.1f}{total:>10.2f}'
+                + (f'   ({dropped} dropped)' if queued and dropped else ''))
+            sink.close()
+
+    path = os.path.join(directory, 'storm.log')
+    app, logs = app_with(logging.FileHandler(path), True)
+    p50, p99, _ = time_records(app, args.records, error=True)
+    logs.stop()
+    with open(path) as f:
+        written = sum(1 for _ in f)
+    print(f'\n{args.records} identical errors: {written} written, '
+        f'{logs.limiter.stats()[0]["suppressed"]} suppressed, p50 {p50:.1f}us p99 {p99:.1f}us')
+
+if __name__ == '__main__':
+    main()
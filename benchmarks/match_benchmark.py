@@ -0,0 +1,94 @@
+"""Artist-venue matching: index build, lookup and update cost at scale.
+
+Usage: python benchmarks/match_benchmark.py [--artists 100000] [--venues 50000]
+           [--seeking 0.3] [--limit 6] [--lookups 500]
+
+Builds matching.MatchIndex over synthetic seeking artists and venues, spread
+over the form's genres and states like benchmarks/datagen.py, without a
+database. Times top-k lookups in both directions against a pairwise scan
+that scores every candidate, and the edit of one candidate.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from forms import GENRES, STATES
+from matching import Candidate, MatchIndex, GENRE_WEIGHT, activity
+
+def entities(count, cities, rng):
+    return [(id, Candidate(f'Name {id}', *rng.choice(cities)[::-1], '', tuple(rng.sample(GENRES, rng.randint(1, 3))),
+        activity(rng.randint(0, 20)))) for id in range(1, count + 1)]
+
+def pairwise(index, genres, state, city, limit):
+    # Every candidate scored, as a query without the inverted indexes would
+    scored = []
+    for id, candidate in index.candidates.items():
+        shared = len(genres.intersection(candidate.genres))
+        if shared:
+            location = (candidate.state == state) + (candidate.state == state and candidate.city == city)
+            scored.append((GENRE_WEIGHT * shared + location + candidate.activity, id))
+    return sorted(scored, reverse=True)[:limit]
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples), samples[int(len(samples) * 0.99)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--artists', type=int, default=100000)
+    parser.add_argument('--venues', type=int, default=50000)
+    parser.add_argument('--seeking', type=float, default=0.3, help='share of each that is seeking')
+    parser.add_argument('--limit', type=int, default=6)
+    parser.add_argument('--lookups', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    cities = [(rng.choice(STATES), f'City {i}') for i in range(max(args.venues // 25, 1))]
+    everyone = {'artists': entities(args.artists, cities, rng), 'venues': entities(args.venues, cities, rng)}
+    indexes = {}
+    print(f'{"index":<10}{"seeking":>10}{"build s":>10}{"MiB":>10}')
+    for kind, rows in everyone.items():
+        seeking = [row for row in rows if rng.random() < args.seeking]
+        start = time.perf_counter()
+        MatchIndex(seeking)
+        build = time.perf_counter() - start
+        # Measured on a second build, as tracing slows it several times over
+        tracemalloc.start()
+        indexes[kind] = MatchIndex(seeking)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'{kind:<10}{len(seeking):>10}{build:>10.2f}{memory / 2 ** 20:>10.1f}')
+
+    print(f'\n{"lookup":<24}{"p50 ms":>10}{"p99 ms":>10}{"scan p50 ms":>14}')
+    for subjects, kind in (('venues', 'artists'), ('artists', 'venues')):
+        index = indexes[kind]
+        timings, scans = [], []
+        for _ in range(args.lookups):
+            _, subject = rng.choice(everyone[subjects])
+            start = time.perf_counter()
+            found = index.search(subject.genres, subject.state, subject.city, args.limit)
+            timings.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            expected = pairwise(index, set(subject.genres), subject.state, subject.city, args.limit)
+            scans.append((time.perf_counter() - start) * 1000)
+            assert [match['score'] for match in found] == [round(score, 2) for score, _ in expected]
+        p50, p99 = percentiles(timings)
+        print(f'{kind + " for a " + subjects[:-1]:<24}{p50:>10.2f}{p99:>10.2f}{percentiles(scans)[0]:>14.2f}')
+
+    timings = []
+    for _ in range(200):
+        id, candidate = rng.choice(list(indexes['venues'].candidates.items()))
+        start = time.perf_counter()
+        indexes['venues'].update({id: candidate._replace(genres=tuple(rng.sample(GENRES, 2)))})
+        timings.append((time.perf_counter() - start) * 1000)
+    p50, p99 = percentiles(timings)
+    print(f'{"edit a venue":<24}{p50:>10.2f}{p99:>10.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Checks that mixed traffic returns every pooled connection.
+
+Usage: python benchmarks/pool_leaks.py [--requests 10000] [--threads 16] [--database-url URL]
+
+Sends a mix of listing, detail, search, export, form and failing requests
+from several threads through the test client, then compares connection
+checkouts with checkins. Exits 1 if any connection is still checked out.
+Without --database-url a fresh SQLite file is used.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from cache import cache
+from database import pool_stats
+from models import db, Venue, Artist, Show
+
+app = create_app()
+
+ROWS = 200
+
+def seed():
+    now = datetime.utcnow()
+    db.session.execute(Venue.__table__.insert(), [
+        {'name': f'Venue {i}', 'city': f'City {i % 10}', 'state': 'NY',
+            'address': f'{i} Main St', 'phone': '123-123-1234'} for i in range(ROWS)])
+    db.session.execute(Artist.__table__.insert(), [
+        {'name': f'Artist {i}', 'city': f'City {i % 10}', 'state': 'NY', 'phone': '123-123-1234'}
+        for i in range(ROWS)])
+    db.session.execute(Show.__table__.insert(), [
+        {'venue_id': i % ROWS + 1, 'artist_id': i * 7 % ROWS + 1,
+            'start_time': now + timedelta(days=i - ROWS)} for i in range(ROWS * 2)])
+    db.session.commit()
+
+def mixed_request(client, rng):
+    id = rng.randint(1, ROWS)
+    choice = rng.randrange(8)
+    if choice == 0:
+        return client.get('/venues')
+    if choice == 1:
+        return client.get(f'/venues/{id}')
+    if choice == 2:
+        return client.get(f'/artists/{id}')
+    if choice == 3:
+        return client.post('/artists/search', data={'search_term': 'tist 1'})
+    if choice == 4:
+        return client.get('/api/v1/shows?fields=id,start_time')
+    if choice == 5:
+        return client.get('/shows')
+    if choice == 6:
+        # Unknown ids take the error paths
+        return client.get(f'/venues/{ROWS + id}')
+    return client.post('/shows/create', data={
+        'artist_id': id, 'venue_id': id, 'start_time': '2030-01-01 20:00:00'})
+
+def run(total, threads):
+    done = iter(range(total))
+    lock = threading.Lock()
+    failures = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        while True:
+            with lock:
+                if next(done, None) is None:
+                    return
+            response = mixed_request(client, rng)
+            response.get_data()
+            response.close()
+            if response.status_code >= 500:
+                failures.append(response.status_code)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=args.database_url or 'sqlite:///' + os.path.join(directory, 'pool.db'),
+        WTF_CSRF_ENABLED=False, CACHE_TYPE='null')
+    cache.init_app(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        db.session.remove()
+        pool_stats.reset()
+
+    elapsed, failures = run(args.requests, args.threads)
+
+    with app.app_context():
+        status = db.pool_status()
+    print(f'{args.requests} requests on {args.threads} threads in {elapsed:.1f}s '
+        f'({args.requests / elapsed:.0f} req/s), {len(failures)} server errors')
+    for key, value in status.items():
+        print(f'{key:<12}{value}')
+    with app.app_context():
+        db.drop_all()
+    if status['checked_out'] or status['checkouts'] != status['checkins']:
+        print('Connections leaked')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
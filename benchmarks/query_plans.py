@@ -0,0 +1,176 @@
+"""Fails when a hot query on the Show table falls back to a full table scan.
+
+Usage: python benchmarks/query_plans.py [--database-url URL]
+
+Seeds a small catalogue (a fresh SQLite file by default; the Postgres
+database given with --database-url must be empty), requests the listing and
+detail pages through the Flask test client, and runs EXPLAIN on every
+statement they issue that reads "Show". Then revalidates each page with its
+ETag, expecting a 304, and checks the version queries those run more
+strictly, as it does the queries that keep the suggest and match indexes
+in sync: they may not scan any table, and an aggregate over updated_at
+must be answered from an index on it. On Postgres sequential scans are
+disabled for the check, so a plan that still scans means no index can
+serve the query. Exits with status 1 when such a plan is found.
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db, Venue, Artist, Show
+from suggest import suggestions
+from matching import matches
+import counters
+
+app = create_app()
+
+PAGES = ['/venues', '/venues/NY/City%200', '/artists', '/shows', '/shows?per_page=2', '/venues/1', '/artists/1']
+
+def seed():
+    now = datetime.datetime.now()
+    for i in range(20):
+        db.session.add(Venue(name=f'Venue {i}', city=f'City {i % 4}', state='NY',
+            address='1 Main St', phone='123-123-1234', genres=['Jazz']))
+        db.session.add(Artist(name=f'Artist {i}', city=f'City {i % 4}', state='NY',
+            phone='123-123-1234', genres=['Jazz']))
+    db.session.flush()
+    for i in range(200):
+        db.session.add(Show(venue_id=1 + i % 20, artist_id=1 + i % 7,
+            start_time=now + datetime.timedelta(days=i - 100)))
+    db.session.flush()
+    counters.refresh(Venue, range(1, 21))
+    counters.refresh(Artist, range(1, 21))
+    db.session.commit()
+
+UPDATED_AT_AGGREGATE = re.compile(r'(max|min)\(("?\w+"?)\.updated_at\)', re.IGNORECASE)
+
+def capture_statements(paths, revalidate=False):
+    # SELECT statements the pages issue; with revalidate, only those of a
+    # second request carrying the first one's ETag, which must be a 304
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+    client = app.test_client()
+    for path in paths:
+        etag = client.get(path).headers.get('ETag') if revalidate else None
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = client.get(path, headers={'If-None-Match': etag} if etag else {})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        expected = 304 if revalidate else 200
+        if response.status_code != expected:
+            sys.exit(f'{path} returned {response.status_code}, expected {expected}')
+    return statements
+
+def capture_sync_statements():
+    # The statements on updated_at of loading each suggest and match index
+    # and then syncing it
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'updated_at' in statement:
+            statements.append((statement, parameters))
+    app.config.update(SUGGEST_SYNC_SECONDS=0, MATCH_SYNC_SECONDS=0)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        for indexes in (suggestions, matches):
+            indexes.init_app(app)
+            for kind in indexes.MODELS:
+                indexes.index(kind)
+                indexes.index(kind)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+def plan(statement, parameters):
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if db.engine.dialect.name == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute('SET enable_seqscan = off')
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        return [row[0].strip() for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+def full_scans(lines, table=None, strict=False):
+    # The plan lines that read every row of table, or of any table. SQLite
+    # reads "SCAN t USING COVERING INDEX" for a walk over a whole index,
+    # which strict counts as a scan too.
+    if db.engine.dialect.name == 'sqlite':
+        return [line for line in lines if line.startswith('SCAN') and (table is None or table in line)
+            and line != 'SCAN CONSTANT ROW'
+            and (strict or ('COVERING INDEX' not in line and 'USING INDEX' not in line))]
+    return [line for line in lines if (table is None or f'"{table}"' in line or f' {table} ' in line)
+        and ('Seq Scan on' in line or (strict and 'Index Only Scan' in line and 'Backward' not in line))]
+
+def updated_at_without_index(statement, lines):
+    # An aggregate over a table's updated_at has to read the end of an index
+    # on it
+    problems = []
+    for table in {match.strip('"') for _, match in UPDATED_AT_AGGREGATE.findall(statement)}:
+        if not any(table in line and 'updated_at' in line for line in lines):
+            problems.append(f'no index on {table}.updated_at')
+    return problems
+
+def report(kind, statement, problems):
+    print(f'{kind}:', ' '.join(statement.split()))
+    for line in problems:
+        print('   ', line)
+
+def check(database_url):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed()
+        failures = 0
+        for statement, parameters in capture_statements(PAGES):
+            if '"Show"' not in statement:
+                continue
+            scans = full_scans(plan(statement, parameters), 'Show')
+            if scans:
+                failures += 1
+                report('FULL SCAN', statement, scans)
+        for statement, parameters in capture_statements(PAGES, revalidate=True):
+            lines = plan(statement, parameters)
+            problems = full_scans(lines, strict=True) + updated_at_without_index(statement, lines)
+            if problems:
+                failures += 1
+                report('VERSION CHECK', statement, problems)
+        for statement, parameters in capture_sync_statements():
+            lines = plan(statement, parameters)
+            problems = full_scans(lines, strict=True) + updated_at_without_index(statement, lines)
+            if problems:
+                failures += 1
+                report('INDEX SYNC', statement, problems)
+        db.session.remove()
+        db.drop_all()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    if args.database_url:
+        failures = check(args.database_url)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            failures = check('sqlite:///' + os.path.join(tmp, 'plans.db'))
+    print(f'{failures} quer{"y" if failures == 1 else "ies"} scanning a table')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Checks read replica routing and read-your-writes with two local databases.
+
+Usage: python benchmarks/replicas.py [--primary-url URL] [--replica-url URL]
+
+Creates the schema in both databases (fresh SQLite files by default; two
+empty Postgres databases also work, nothing replicates between them) and
+gives venue 1 a different name in each, so each page tells which one it
+was read from. Then, through two test clients:
+
+  - a GET reads from the replica;
+  - editing the venue writes to the primary only;
+  - the client that wrote reads from the primary until
+    REPLICA_STICKY_SECONDS have passed, then from the replica again;
+  - the other client reads from the replica throughout;
+  - reads outside a request use the primary.
+
+Exits with status 1 if any of these does not hold.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Venue
+
+STICKY_SECONDS = 1
+
+def venue_form(name):
+    return {'name': name, 'city': 'City 0', 'state': 'NY', 'address': '1 Main St',
+        'phone': '123-123-1234', 'genres': ['Jazz']}
+
+def name_on_page(client):
+    page = client.get('/venues/1').get_data(as_text=True)
+    for name in ('Primary Hall', 'Replica Hall', 'Edited Hall'):
+        if f'>{name}<' in page:
+            return name
+
+def check(primary_url, replica_url):
+    app = create_app(SQLALCHEMY_DATABASE_URI=primary_url, SQLALCHEMY_BINDS={'replica0': replica_url},
+        REPLICA_STICKY_SECONDS=STICKY_SECONDS, WTF_CSRF_ENABLED=False, CACHE_TYPE='null')
+    failures = []
+    def expect(what, actual, expected):
+        print(f'{what:<52}{actual}')
+        if actual != expected:
+            failures.append(f'{what}: {actual}, expected {expected}')
+
+    with app.app_context():
+        replica = db.get_engine(app, 'replica0')
+        for engine in (db.engine, replica):
+            db.Model.metadata.drop_all(engine)
+            db.Model.metadata.create_all(engine)
+        db.session.add(Venue(**venue_form('Primary Hall')))
+        db.session.commit()
+        # The replica's copy, written around the app as replication would
+        with replica.begin() as connection:
+            connection.execute(Venue.__table__.insert(), {
+                key: value for key, value in venue_form('Replica Hall').items() if key != 'genres'})
+
+    writer, reader = app.test_client(), app.test_client()
+    expect('GET reads from', name_on_page(writer), 'Replica Hall')
+    writer.post('/venues/1/edit', data=venue_form('Edited Hall'))
+    with app.app_context():
+        expect('primary after the edit, read outside a request', Venue.query.get(1).name, 'Edited Hall')
+        expect('replica after the edit', replica.execute('SELECT name FROM "Venue" WHERE id = 1').scalar(),
+            'Replica Hall')
+    expect('writer reads from, just after writing', name_on_page(writer), 'Edited Hall')
+    expect('other visitor reads from', name_on_page(reader), 'Replica Hall')
+    time.sleep(STICKY_SECONDS + 0.1)
+    expect(f'writer reads from, {STICKY_SECONDS}s later', name_on_page(writer), 'Replica Hall')
+
+    with app.app_context():
+        db.drop_all()
+        db.Model.metadata.drop_all(db.get_engine(app, 'replica0'))
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--primary-url')
+    parser.add_argument('--replica-url')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = check(args.primary_url or 'sqlite:///' + os.path.join(tmp, 'primary.db'),
+            args.replica_url or 'sqlite:///' + os.path.join(tmp, 'replica.db'))
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Checks that revalidating a page with its ETag costs one query and no rendering.
+
+Usage: python benchmarks/revalidation.py [--database-url URL]
+
+Seeds a small catalogue (a fresh SQLite file by default), then for each
+listing and detail page takes the ETag of a first GET and sends it back in
+If-None-Match. The second response must be a 304 after exactly one query,
+the version check, without a call to render_template. Then renames an
+artist and expects the pages showing it to answer the same ETag with a 200
+carrying the new name. Exits with status 1 on any failure.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import app as views
+from models import db, Artist
+from query_plans import PAGES, seed
+
+app = views.create_app()
+
+def revalidate(client, path, etag):
+    # The response, its statements and the render_template calls it made
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        with mock.patch.object(views, 'render_template', wraps=views.render_template) as render:
+            response = client.get(path, headers={'If-None-Match': etag})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return response, statements, render.call_count
+
+def check(database_url):
+    app.config.update(SQLALCHEMY_DATABASE_URI=database_url, WTF_CSRF_ENABLED=False)
+    failures = []
+    with app.app_context():
+        db.create_all()
+        seed()
+        db.session.remove()
+        client = app.test_client()
+        etags = {path: client.get(path).headers.get('ETag') for path in PAGES}
+        print(f'{"page":<24}{"status":>8}{"queries":>10}{"renders":>10}')
+        for path in PAGES:
+            if not etags[path]:
+                failures.append(f'{path} has no ETag')
+                continue
+            response, statements, renders = revalidate(client, path, etags[path])
+            print(f'{path:<24}{response.status_code:>8}{len(statements):>10}{renders:>10}')
+            if response.status_code != 304 or len(statements) != 1 or renders:
+                failures.append(f'{path} revalidated with {response.status_code}, '
+                    f'{len(statements)} queries and {renders} renders')
+
+        Artist.query.get(1).name = 'Renamed Artist'
+        db.session.commit()
+        db.session.remove()
+        for path in ('/artists', '/artists/1', '/venues/1', '/shows'):
+            response, _, _ = revalidate(client, path, etags[path])
+            if response.status_code != 200 or b'Renamed Artist' not in response.data:
+                failures.append(f'{path} still served the old page after the rename ({response.status_code})')
+        db.session.remove()
+        db.drop_all()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    if args.database_url:
+        failures = check(args.database_url)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            failures = check('sqlite:///' + os.path.join(tmp, 'revalidation.db'))
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
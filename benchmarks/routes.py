@@ -0,0 +1,234 @@
+"""Latency, query count and memory of every route at several catalogue sizes.
+
+Usage: python benchmarks/routes.py [--shows 1000 100000] [--requests 50]
+           [--database-url URL] [--cache] [--output results.json]
+           [--compare baseline.json] [--threshold 1.25]
+
+For each size a catalogue is generated with datagen.py (same seed, same
+rows), then every route in app.py is requested through the test client:
+a couple of warm-up requests, --requests timed ones, and one more under
+tracemalloc for the peak allocation. The page cache is off unless --cache
+is given. Results go to --output as JSON; with --compare, p95 latencies
+are checked against an earlier file and the run fails when one grew by
+more than --threshold times.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import create_app
+from cache import cache
+from models import db, VenueArea
+import datagen
+
+app = create_app(DEBUG_ENDPOINTS=True)
+
+WARMUP = 2
+
+def venue_form(rng):
+    return {'name': f'Bench Venue {rng.random()}', 'city': 'City 0', 'state': 'NY', 'address': '1 Main St',
+        'phone': '123-123-1234', 'genres': ['Jazz', 'Rock']}
+
+def artist_form(rng):
+    return {'name': f'Bench Artist {rng.random()}', 'city': 'City 0', 'state': 'NY',
+        'phone': '123-123-1234', 'genres': ['Jazz']}
+
+def routes(data):
+    # (endpoint, method, request kwargs for the test client given a random
+    # generator and the request number). Bookings use a fresh far-future slot
+    # each time so they are never rejected as clashes.
+    venue = lambda rng: rng.randint(1, data['venues'])
+    artist = lambda rng: rng.randint(1, data['artists'])
+    slot = lambda i: (datetime(2200, 1, 1) + timedelta(hours=3 * i))
+    area = data['area']
+    return [
+        ('index', 'GET', lambda rng, i: {'path': '/'}),
+        ('venues', 'GET', lambda rng, i: {'path': '/venues'}),
+        ('venues', 'GET', lambda rng, i: {'path': '/venues?genre=Jazz'}),
+        ('venues_in_area', 'GET', lambda rng, i: {'path': f'/venues/{area[0]}/{area[1]}'}),
+        ('search_venues', 'GET', lambda rng, i: {'path': '/venues/search?search_term=hall'}),
+        ('search_venues', 'POST', lambda rng, i: {'path': '/venues/search', 'data': {'search_term': 'jazz club'}}),
+        ('show_venue', 'GET', lambda rng, i: {'path': f'/venues/{venue(rng)}'}),
+        ('create_venue_form', 'GET', lambda rng, i: {'path': '/venues/create'}),
+        ('create_venue_submission', 'POST', lambda rng, i: {'path': '/venues/create', 'data': venue_form(rng)}),
+        ('edit_venue', 'GET', lambda rng, i: {'path': f'/venues/{venue(rng)}/edit'}),
+        ('edit_venue_submission', 'POST', lambda rng, i: {'path': f'/venues/{venue(rng)}/edit', 'data': venue_form(rng)}),
+        ('artists', 'GET', lambda rng, i: {'path': '/artists'}),
+        ('search_artists', 'GET', lambda rng, i: {'path': '/artists/search?search_term=band'}),
+        ('search_artists', 'POST', lambda rng, i: {'path': '/artists/search', 'data': {'search_term': 'hop'}}),
+        ('show_artist', 'GET', lambda rng, i: {'path': f'/artists/{artist(rng)}'}),
+        ('create_artist_form', 'GET', lambda rng, i: {'path': '/artists/create'}),
+        ('create_artist_submission', 'POST', lambda rng, i: {'path': '/artists/create', 'data': artist_form(rng)}),
+        ('edit_artist', 'GET', lambda rng, i: {'path': f'/artists/{artist(rng)}/edit'}),
+        ('edit_artist_submission', 'POST', lambda rng, i: {'path': f'/artists/{artist(rng)}/edit', 'data': artist_form(rng)}),
+        ('shows', 'GET', lambda rng, i: {'path': '/shows'}),
+        ('create_shows', 'GET', lambda rng, i: {'path': '/shows/create'}),
+        ('create_show_submission', 'POST', lambda rng, i: {'path': '/shows/create', 'data': {
+            'venue_id': venue(rng), 'artist_id': artist(rng), 'start_time': f'{slot(i):%Y-%m-%d %H:%M:%S}'}}),
+        ('api_export', 'GET', lambda rng, i: {'path': '/api/v1/venues?fields=id,name&genre=Jazz'}),
+        ('api_suggest', 'GET', lambda rng, i: {'path': '/api/v1/suggest/artists?q=' + rng.choice(datagen.WORDS)[:3]}),
+        ('api_matches', 'GET', lambda rng, i: {'path': f'/api/v1/venues/{venue(rng)}/matches'}),
+        ('api_matches', 'GET', lambda rng, i: {'path': f'/api/v1/artists/{artist(rng)}/matches'}),
+        ('api_book_shows', 'POST', lambda rng, i: {'path': '/api/v1/shows', 'json': [
+            {'venue_id': venue(rng), 'artist_id': artist(rng), 'start_time': slot(i).isoformat()}]}),
+        ('cache_stats', 'GET', lambda rng, i: {'path': '/_cache'}),
+        ('pool_stats', 'GET', lambda rng, i: {'path': '/_pool'}),
+        ('recent_logs', 'GET', lambda rng, i: {'path': '/_logs?limit=20'}),
+        ('prometheus_metrics', 'GET', lambda rng, i: {'path': '/_metrics'}),
+        ('static', 'GET', lambda rng, i: {'path': '/static/css/main.css'}),
+        # Deletes the highest ids, one per request; runs last
+        ('delete_venue', 'DELETE', lambda rng, i: {'path': f'/venues/{data["venues"] - i}'}),
+    ]
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self.record)
+
+    def record(self, *args):
+        self.count += 1
+
+def request(client, method, kwargs):
+    response = client.open(method=method, **kwargs)
+    response.get_data()
+    response.close()
+    return response.status_code
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+def run(shows, requests, database_url, counter):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    with app.app_context():
+        datagen.reset()
+        started = time.perf_counter()
+        data = datagen.generate(shows)
+        data['seconds_to_generate'] = round(time.perf_counter() - started, 2)
+        area = VenueArea.query.order_by(VenueArea.venue_count.desc()).first()
+        data['area'] = (area.state, area.city)
+        db.session.remove()
+    print(f'\n{shows} shows: {data["venues"]} venues, {data["artists"]} artists, '
+        f'up to {data["max_shows_per_venue"]} shows per venue')
+    print(f'{"route":<42}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"peak KiB":>10}')
+
+    client = app.test_client()
+    results = {}
+    rng = random.Random(shows)
+    for i, (endpoint, method, make) in enumerate(routes(data)):
+        name = f'{method} {endpoint}' + (f' {make(rng, 0)["path"]}' if endpoint in ('venues',) else '')
+        latencies, queries, statuses = [], [], set()
+        for n in range(WARMUP + requests):
+            kwargs = make(rng, n)
+            counter.count = 0
+            started = time.perf_counter()
+            statuses.add(request(client, method, kwargs))
+            if n >= WARMUP:
+                latencies.append((time.perf_counter() - started) * 1000)
+                queries.append(counter.count)
+        tracemalloc.start()
+        request(client, method, make(rng, WARMUP + requests))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'queries': round(statistics.mean(queries), 2),
+            'peak_kib': round(peak / 1024, 1),
+            'statuses': sorted(statuses),
+        }
+        row = results[name]
+        print(f'{name[:41]:<42}{row["p50_ms"]:>9.2f}{row["p95_ms"]:>9.2f}{row["p99_ms"]:>9.2f}'
+            f'{row["queries"]:>9.1f}{row["peak_kib"]:>10.0f}')
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    return {'data': data, 'routes': results}
+
+def uncovered():
+    # Rules of app.py the suite does not request
+    covered = {(endpoint, method) for endpoint, method, _ in routes({'venues': 1, 'artists': 1, 'area': ('', '')})}
+    return sorted(f'{method} {rule.rule}' for rule in app.url_map.iter_rules()
+        for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.endpoint, method) not in covered)
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = {run['data']['shows']: run['routes'] for run in json.load(f)['runs']}
+    regressions = 0
+    print(f'\nAgainst {baseline_path} (p95, fails above x{threshold}):')
+    for run in results['runs']:
+        before = baseline.get(run['data']['shows'], {})
+        for name, row in run['routes'].items():
+            if name in before and before[name]['p95_ms'] > 0:
+                ratio = row['p95_ms'] / before[name]['p95_ms']
+                if ratio > threshold:
+                    regressions += 1
+                    print(f'  {run["data"]["shows"]} shows {name}: {before[name]["p95_ms"]:.2f} -> '
+                        f'{row["p95_ms"]:.2f} ms (x{ratio:.2f})')
+    print(f'{regressions} regression{"" if regressions == 1 else "s"}')
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, nargs='+', default=[1000, 100000])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--database-url')
+    parser.add_argument('--cache', action='store_true', help='Keep the page cache on.')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args()
+
+    app.config.update(WTF_CSRF_ENABLED=False, CACHE_TYPE='memory' if args.cache else 'null')
+    cache.init_app(app)
+    missing = uncovered()
+    if missing:
+        print('Not covered:', ', '.join(missing))
+    counter = StatementCounter()
+    results = {
+        'meta': {
+            'started': datetime.utcnow().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': args.database_url.split(':')[0] if args.database_url else 'sqlite',
+            'requests': args.requests,
+            'cache': args.cache,
+        },
+        'runs': [],
+    }
+    for shows in args.shows:
+        if args.database_url:
+            results['runs'].append(run(shows, args.requests, args.database_url, counter))
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                results['runs'].append(run(shows, args.requests, 'sqlite:///' + os.path.join(tmp, 'bench.db'), counter))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nResults written to {args.output}')
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
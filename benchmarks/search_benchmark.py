@@ -0,0 +1,89 @@
+"""Venue name search latency at increasing table sizes.
+
+Usage: python benchmarks/search_benchmark.py [--rows 100000 1000000] [--database-url URL]
+
+Without --database-url each size is loaded into a fresh SQLite file, so the
+FTS5 path is measured next to the unindexed ILIKE query it replaces. Against
+Postgres the database must be empty; the trigram index path is measured.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, Venue
+from search import search, escape_like
+
+app = create_app()
+
+WORDS = ['Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live', 'Music',
+    'Coffee', 'Jazz', 'Club', 'Hall', 'Room', 'Garden', 'Lounge', 'Tavern', 'Stage', 'House']
+TERMS = ['hop', 'piano', 'jazz club', 'garden', 'ounge', 'zzz']
+STATES = ['CA', 'NY', 'TX', 'WA', 'IL']
+
+def seed(rows):
+    rng = random.Random(rows)
+    insert = Venue.__table__.insert()
+    batch = []
+    for i in range(rows):
+        batch.append({
+            'name': ' '.join(rng.sample(WORDS, 3)) + f' {i}',
+            'city': f'City {i % 500}', 'state': STATES[i % len(STATES)],
+            'address': f'{i} Main St', 'phone': '123-123-1234',
+        })
+        if len(batch) == 10000:
+            db.session.execute(insert, batch)
+            batch = []
+    if batch:
+        db.session.execute(insert, batch)
+    db.session.commit()
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def run(rows, database_url, repeat):
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        start = time.perf_counter()
+        seed(rows)
+        print(f'\n{rows} venues seeded in {time.perf_counter() - start:.1f}s')
+        print(f'{"term":<12}{"indexed ms":>12}{"old ms":>12}{"matches":>10}')
+        for term in TERMS:
+            indexed = timed(lambda: search(Venue, term, per_page=20), repeat)
+            # What the search handlers did before: an unindexed ILIKE
+            # returning every match
+            scan = timed(lambda: db.session.query(Venue.id, Venue.name)
+                .filter(Venue.name.ilike(f'%{escape_like(term)}%', escape='\\')).all(), repeat)
+            count = search(Venue, term, per_page=1)['count']
+            print(f'{term:<12}{indexed:>12.2f}{scan:>12.2f}{count:>10}')
+        db.session.remove()
+        db.drop_all()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--database-url')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    for rows in args.rows:
+        if args.database_url:
+            run(rows, args.database_url, args.repeat)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                run(rows, 'sqlite:///' + os.path.join(tmp, 'search.db'), args.repeat)
+
+if __name__ == '__main__':
+    main()
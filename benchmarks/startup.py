@@ -0,0 +1,92 @@
+"""Worker cold start: import time per module, create_app() and first request.
+
+Usage: python benchmarks/startup.py [--runs 5] [--top 25]
+
+Each run is a fresh interpreter, as a newly forked or autoscaled worker
+would be. The first one runs with python -X importtime and its report is
+summed per top-level package; every run then times the import of app,
+create_app() and the first GET / and GET /venues/create, once with the
+template bytecode cache cleared and once after it was filled.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER = '''
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(WTF_CSRF_ENABLED=False, CACHE_TYPE='null', TEMPLATE_CACHE_DIR=sys.argv[1])
+created = time.perf_counter()
+client = app.test_client()
+timings = {'import_ms': imported - started, 'create_app_ms': created - imported}
+for name, path in (('first_home_ms', '/'), ('first_venue_form_ms', '/venues/create')):
+    before = time.perf_counter()
+    client.get(path).close()
+    timings[name] = time.perf_counter() - before
+print(json.dumps({key: round(value * 1000, 2) for key, value in timings.items()}))
+'''
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)')
+
+def worker(template_dir, *flags):
+    result = subprocess.run([sys.executable, *flags, '-c', WORKER, template_dir], cwd=ROOT,
+        capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def import_times(stderr):
+    # Cumulative microseconds of each module app.py (or the worker) imports
+    # directly, and self time summed per package. A module's cumulative time
+    # includes the shared dependencies it happened to import first.
+    cumulative, by_package = {}, defaultdict(int)
+    for self_us, cumulative_us, indent, name in IMPORTTIME.findall(stderr):
+        if len(indent) == 3:
+            cumulative[name] = int(cumulative_us)
+        by_package[name.split('.')[0]] += int(self_us)
+    return cumulative, by_package
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    template_dir = tempfile.mkdtemp()
+    try:
+        _, stderr = worker(template_dir, '-X', 'importtime')
+        cumulative, by_package = import_times(stderr)
+        print(f'{"direct imports":<40}{"cumulative ms":>14}')
+        for name, us in sorted(cumulative.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'{name:<40}{us / 1000:>14.1f}')
+        print(f'\n{"package":<40}{"self ms":>14}')
+        for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+            print(f'{name:<40}{us / 1000:>14.1f}')
+
+        runs = {'cold templates': [], 'compiled templates': []}
+        for _ in range(args.runs):
+            shutil.rmtree(template_dir)
+            os.makedirs(template_dir)
+            runs['cold templates'].append(worker(template_dir)[0])
+            runs['compiled templates'].append(worker(template_dir)[0])
+    finally:
+        shutil.rmtree(template_dir, ignore_errors=True)
+
+    keys = list(runs['cold templates'][0])
+    print(f'\nmedian of {args.runs} runs (ms)')
+    print(f'{"":<22}' + ''.join(f'{key[:-3]:>22}' for key in keys))
+    for name, samples in runs.items():
+        print(f'{name:<22}' + ''.join(f'{statistics.median(run[key] for run in samples):>22.1f}' for key in keys))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Typeahead prefix index: lookup and update latency and memory by size.
+
+Usage: python benchmarks/suggest_benchmark.py [--rows 10000 1000000] [--limit 10]
+
+Builds suggest.PrefixIndex over synthetic venue names, without a database,
+then times lookups for prefixes of one to ten characters, including ones
+nothing matches, and puts that rename an existing entity.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from suggest import PrefixIndex
+
+WORDS = ['Musical', 'Hop', 'Dueling', 'Pianos', 'Bar', 'Park', 'Square', 'Live', 'Music',
+    'Coffee', 'Jazz', 'Club', 'Hall', 'Room', 'Garden', 'Lounge', 'Tavern', 'Stage', 'House']
+PREFIXES = ['j', 'ja', 'jazz', 'jazz c', 'jazz club', 'dueling pi', 'the', 'zz', 'q']
+LOOKUPS = 2000
+
+def names(rows, rng):
+    return [(i, ' '.join(rng.sample(WORDS, 3)) + f' {i}') for i in range(1, rows + 1)]
+
+def run(rows, limit):
+    rng = random.Random(rows)
+    rows_ = names(rows, rng)
+    start = time.perf_counter()
+    index = PrefixIndex(rows_)
+    build = time.perf_counter() - start
+    # Measured on a second build, as tracing slows it several times over
+    del index
+    tracemalloc.start()
+    index = PrefixIndex(rows_)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del rows_
+
+    lookups = {}
+    for prefix in PREFIXES:
+        samples = []
+        for _ in range(LOOKUPS):
+            start = time.perf_counter()
+            index.search(prefix, limit)
+            samples.append((time.perf_counter() - start) * 1e6)
+        lookups[prefix] = (statistics.median(samples), sorted(samples)[int(LOOKUPS * 0.99)])
+
+    samples = []
+    for _ in range(200):
+        id = rng.randint(1, rows)
+        start = time.perf_counter()
+        index.put(id, ' '.join(rng.sample(WORDS, 3)) + f' {id}')
+        samples.append((time.perf_counter() - start) * 1e6)
+
+    print(f'\n{rows} names: built in {build:.2f}s, {memory / rows:.0f} bytes each '
+        f'({memory / 2 ** 20:.0f} MiB)')
+    print(f'{"prefix":<14}{"p50 us":>10}{"p99 us":>10}{"matches":>10}')
+    for prefix, (p50, p99) in lookups.items():
+        print(f'{prefix!r:<14}{p50:>10.1f}{p99:>10.1f}{len(index.search(prefix, limit)):>10}')
+    print(f'{"rename (put)":<14}{statistics.median(samples):>10.1f}{sorted(samples)[198]:>10.1f}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+    for rows in args.rows:
+        run(rows, args.limit)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+from sqlalchemy import DDL, DateTime, Integer, event, func, literal, select, union_all
+from models import db, Venue, Artist, Show
+import counters
+
+# A show holds its venue and its artist for SHOW_LENGTH from its start time,
+# so two bookings clash when their start times are less than SHOW_LENGTH
+# apart. Checking a booking is then a range seek on the (venue_id,
+# start_time) and (artist_id, start_time) indexes, O(log n) whatever the
+# number of shows. A batch is checked in one query per CHECK_CHUNK bookings
+# and side, joining their windows to Show. On Postgres exclusion
+# constraints enforce the same rule, so concurrent bookings cannot both get
+# through.
+
+SHOW_LENGTH = timedelta(hours=3)
+# Bookings per clash query, SQLite's limit on the SELECTs of a UNION ALL
+CHECK_CHUNK = 500
+
+def exclusion_ddl():
+    length = f"interval '{int(SHOW_LENGTH.total_seconds())} seconds'"
+    return ['CREATE EXTENSION IF NOT EXISTS btree_gist'] + [
+        f'ALTER TABLE "Show" ADD CONSTRAINT "Show_{column}_slot_excl" EXCLUDE USING gist '
+        f'({column} WITH =, tsrange(start_time, start_time + {length}) WITH &&)'
+        for column in ('venue_id', 'artist_id')]
+
+for _statement in exclusion_ddl():
+    event.listen(Show.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+
+class BookingError(Exception):
+    # errors holds one {field: [messages]} dict per requested booking; clash
+    # tells a slot already taken apart from input that could never be booked
+    def __init__(self, errors, clash=False):
+        super().__init__('; '.join(message for booking in errors
+            for messages in booking.values() for message in messages))
+        self.errors = errors
+        self.clash = clash
+
+
+def invalid(bookings):
+    # Returns, for each booking dict (venue_id, artist_id, start_time), what
+    # is missing or unknown in it; an empty dict means nothing
+    errors = [{} for _ in bookings]
+    known = {}
+    for key, model in (('venue_id', Venue), ('artist_id', Artist)):
+        ids = {booking.get(key) for booking in bookings} - {None}
+        known[key] = {id for (id,) in db.session.query(model.id).filter(model.id.in_(ids))} if ids else set()
+
+    for booking, error in zip(bookings, errors):
+        for key, name in (('venue_id', 'venue'), ('artist_id', 'artist')):
+            if booking.get(key) is None:
+                error[key] = ['This field is required.']
+            elif booking[key] not in known[key]:
+                error[key] = [f'There is no {name} with id {booking[key]}.']
+        if not isinstance(booking.get('start_time'), datetime):
+            error['start_time'] = ['This field is required.']
+    return errors
+
+def clashes(bookings):
+    # Returns, for each valid booking, the shows or other bookings of the
+    # batch it would overlap; an empty dict means none
+    errors = [{} for _ in bookings]
+    for key, column, name in (('venue_id', Show.venue_id, 'venue'), ('artist_id', Show.artist_id, 'artist')):
+        for i, clash in booked(bookings, key, column):
+            errors[i][key] = [f'The {name} already has a show at {clash:%Y-%m-%d %H:%M}.']
+
+    # Bookings in the same batch must not clash with each other either
+    valid = sorted((i for i, error in enumerate(errors) if not error), key=lambda i: bookings[i]['start_time'])
+    for key, name in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        previous = {}
+        for i in valid:
+            booking = bookings[i]
+            before = previous.get(booking[key])
+            if before is not None and booking['start_time'] - bookings[before]['start_time'] < SHOW_LENGTH:
+                errors[i].setdefault(key, []).append(
+                    f'The {name} is also booked at {bookings[before]["start_time"]:%Y-%m-%d %H:%M} in this batch.')
+            else:
+                previous[booking[key]] = i
+    return errors
+
+def booked(bookings, key, column):
+    # Yields (index, earliest overlapping start time) for the bookings whose
+    # venue or artist, as column says, already has a show in their window
+    for start in range(0, len(bookings), CHECK_CHUNK):
+        windows = union_all(*[select([
+            literal(i).label('i'),
+            literal(booking[key], Integer).label('owner'),
+            literal(booking['start_time'] - SHOW_LENGTH, DateTime).label('after'),
+            literal(booking['start_time'] + SHOW_LENGTH, DateTime).label('before'),
+        ]) for i, booking in enumerate(bookings[start:start + CHECK_CHUNK], start)]).alias('windows')
+        yield from db.session.query(windows.c.i, func.min(Show.start_time)) \
+            .join(Show, (column == windows.c.owner) & (Show.start_time > windows.c.after)
+                & (Show.start_time < windows.c.before)) \
+            .group_by(windows.c.i)
+
+def check(bookings):
+    # Returns, for each booking dict, the reasons it cannot be made; an
+    # empty dict means it can
+    errors = invalid(bookings)
+    valid = [i for i, error in enumerate(errors) if not error]
+    for i, error in zip(valid, clashes([bookings[i] for i in valid])):
+        errors[i] = error
+    return errors
+
+def book(bookings):
+    # Adds a show per booking to the session, all or nothing. Raises
+    # BookingError listing every problem; the caller commits.
+    errors = invalid(bookings)
+    if any(errors):
+        raise BookingError(errors)
+    errors = clashes(bookings)
+    if any(errors):
+        raise BookingError(errors, clash=True)
+    now = datetime.utcnow()
+    shows = [Show(venue_id=booking['venue_id'], artist_id=booking['artist_id'],
+        start_time=booking['start_time'], updated_at=now) for booking in bookings]
+    db.session.add_all(shows)
+    db.session.flush()
+    # Also stamps updated_at, which the pages' ETags depend on
+    counters.refresh(Venue, {show.venue_id for show in shows})
+    counters.refresh(Artist, {show.artist_id for show in shows})
+    return shows
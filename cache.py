@@ -0,0 +1,230 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+from datetime import datetime
+from flask import current_app, g, make_response, request, session
+
+# Rendered pages are cached under their path and query string plus the
+# current version of every tag the page depends on ('venue:3', 'shows', ...).
+# Write handlers invalidate a tag by giving it a new version, which makes
+# every page keyed on the old one unreachable; stale entries then age out
+# of the backend through its TTL and size limit. Under @conditional the key
+# also holds the ETag, which comes from the database, so a change made
+# where these tags are not bumped (another worker, a CLI command, a
+# replica catching up) still never serves an old body under a new ETag.
+
+class MemoryBackend:
+    # Per-process LRU with a TTL, for single-worker deployments and tests
+    def __init__(self, max_entries=1000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                    self.stats['evictions'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def version(self, tag):
+        return self.versions.get(tag, '')
+
+    def bump(self, tag):
+        with self.lock:
+            self.versions[tag] = uuid.uuid4().hex
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.versions.clear()
+
+
+class FileSystemBackend:
+    # Entries and tag versions stored as files in a directory shared by all
+    # workers on a host. Counters are per process.
+    def __init__(self, directory, max_entries=10000, ttl=300):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.writes = 0
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _write(self, path, data):
+        # Write then rename so readers in other workers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                self.stats['evictions'] += 1
+                self.stats['misses'] += 1
+                return None
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return value
+
+    def set(self, key, value):
+        self._write(self._path(key), pickle.dumps(value))
+        # Trimming lists the directory, so only do it every hundred writes
+        self.writes += 1
+        if self.writes % 100:
+            return
+        entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        if len(entries) > self.max_entries:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_entries]:
+                try:
+                    os.remove(entry.path)
+                    self.stats['evictions'] += 1
+                except OSError:
+                    pass
+
+    def version(self, tag):
+        try:
+            with open(os.path.join(self.directory, 'tags', tag.replace('/', '_')), 'r') as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def bump(self, tag):
+        fd, tmp = tempfile.mkstemp(dir=os.path.join(self.directory, 'tags'))
+        with os.fdopen(fd, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp, os.path.join(self.directory, 'tags', tag.replace('/', '_')))
+
+    def clear(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                os.remove(os.path.join(root, name))
+
+
+class ResponseCache:
+    # Each app keeps its backend in app.extensions, so setting up another
+    # app leaves this one's cache as it was
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'memory')
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 1000)
+        ttl = app.config.get('CACHE_TTL', 300)
+        if cache_type == 'filesystem':
+            backend = FileSystemBackend(app.config['CACHE_DIR'], max_entries, ttl)
+        elif cache_type == 'memory':
+            backend = MemoryBackend(max_entries, ttl)
+        else:
+            backend = None
+        app.extensions['response_cache'] = backend
+
+    @property
+    def backend(self):
+        # The current app's, or None when it has no cache
+        return current_app.extensions.get('response_cache')
+
+    def cached(self, *tags):
+        # Caches the page a GET view renders. Tags may refer to the view's
+        # arguments, e.g. 'venue:{venue_id}'.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pages carrying flashed messages are personal to one visitor
+                backend = self.backend
+                if backend is None or session.get('_flashes'):
+                    return view(**kwargs)
+                versions = [backend.version(tag.format(**kwargs)) for tag in tags]
+                key = '|'.join([request.path, request.query_string.decode(), g.get('etag', '')] + versions)
+                body = backend.get(key)
+                if body is not None:
+                    return body
+                body = view(**kwargs)
+                if isinstance(body, str) and not session.get('_flashes'):
+                    backend.set(key, body)
+                return body
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        backend = self.backend
+        if backend is not None:
+            for tag in tags:
+                backend.bump(tag)
+
+    def stats(self):
+        backend = self.backend
+        if backend is None:
+            return {}
+        return dict(backend.stats)
+
+
+def conditional(version):
+    # Answers If-None-Match with 304 before the view runs. version takes the
+    # view's arguments and returns a cheap tuple that changes whenever the
+    # page would, or None to skip validation (e.g. unknown id).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if session.get('_flashes'):
+                return view(**kwargs)
+            values = version(**kwargs)
+            if values is None:
+                return view(**kwargs)
+            etag = hashlib.sha1(repr((
+                current_app.config.get('RELEASE'), request.full_path, tuple(values)
+            )).encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                # For @cached below, which keys the body it stores on it
+                g.etag = etag
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            timestamps = [value for value in values if isinstance(value, datetime)]
+            if timestamps:
+                response.last_modified = max(timestamps)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+
+cache = ResponseCache()
@@ -1,5 +1,9 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie, which carries flashed messages and the
+# read-your-writes flag of the replica routing, so every worker needs the
+# same one: set SECRET_KEY whenever more than one runs. The random fallback
+# only suits a single development server.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -11,5 +15,92 @@ DEBUG = True
 
 # TODO IMPLEMENT DATABASE URL
 # SQLALCHEMY_DATABASE_URI = '<Put your local database url>'
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyurapp'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyurapp')
 SQLALCHEMY_TRACK_MODIFICATIONS = True
+
+# Connection pool of each worker process. Keep workers * (DB_POOL_SIZE +
+# DB_MAX_OVERFLOW) below the server's max_connections. DB_STATEMENT_TIMEOUT
+# is in milliseconds and only applies to Postgres.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false'),
+    'connect_args': {
+        'options': '-c statement_timeout=%d' % int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+    },
+}
+
+# Read replicas, as comma-separated URLs. GET requests read from them; a
+# visitor who just wrote something reads from the primary for
+# REPLICA_STICKY_SECONDS (keep it above the usual replication lag).
+SQLALCHEMY_BINDS = {
+    f'replica{i}': url for i, url in
+    enumerate(url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url)
+}
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+# Maximum number of past and upcoming shows loaded on a detail page
+SHOWS_PER_SECTION = 50
+
+# How often each worker's venue and artist name indexes for the show form's
+# typeahead pick up changes made by other workers
+SUGGEST_SYNC_SECONDS = 10
+
+# Same for the seeking venues and artists behind the suggested matches on
+# the detail pages
+MATCH_SYNC_SECONDS = 30
+
+# Default and maximum page sizes for the venue, artist and show listings
+PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+# Rendered page cache: 'memory' (per worker), 'filesystem' (shared through
+# CACHE_DIR by every worker on a host) or 'null' to disable it
+CACHE_TYPE = os.environ.get('CACHE_TYPE', 'memory')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(basedir, '.cache'))
+CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 1000
+
+# Rendered show tiles and genre chips ({% cache %} blocks), same choices as
+# CACHE_TYPE. Keys carry the updated_at of everything a fragment shows, so
+# the TTL only bounds how long unused versions linger.
+FRAGMENT_CACHE_TYPE = os.environ.get('FRAGMENT_CACHE_TYPE', 'memory')
+FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR', os.path.join(CACHE_DIR, 'fragments'))
+FRAGMENT_CACHE_TTL = 86400
+FRAGMENT_CACHE_MAX_ENTRIES = 10000
+
+# Compiled Jinja templates, written by `flask assets build` so new workers
+# skip parsing them; empty to compile in memory on first render
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(CACHE_DIR, 'templates'))
+
+# Part of every ETag, so a deploy that changes templates invalidates pages
+# browsers already hold
+RELEASE = os.environ.get('RELEASE', '')
+
+# Request instrumentation: Server-Timing headers and per-endpoint metrics at
+# /_metrics. TRACE_ALLOCATIONS adds tracemalloc peaks and slows every request;
+# PROFILE_SLOW_MS samples requests and writes folded stacks of the slower ones
+# to PROFILE_DIR.
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION', '') == '1'
+TRACE_ALLOCATIONS = os.environ.get('TRACE_ALLOCATIONS', '') == '1'
+PROFILE_SLOW_MS = int(os.environ.get('PROFILE_SLOW_MS', 0)) or None
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(basedir, 'profiles'))
+
+# Logging: JSON lines written by a background thread to LOG_FILE (stderr in
+# debug mode or when empty), the last LOG_BUFFER_SIZE of them kept for
+# /_logs. Records beyond LOG_QUEUE_SIZE waiting to be written are dropped
+# rather than block requests; repeats of an error within LOG_ERROR_WINDOW
+# seconds are counted instead of logged. LOG_REQUESTS logs every request.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FILE = os.environ.get('LOG_FILE', 'error.log')
+LOG_REQUESTS = os.environ.get('LOG_REQUESTS', '1') == '1'
+LOG_QUEUE_SIZE = 10000
+LOG_BUFFER_SIZE = 1000
+LOG_ERROR_WINDOW = 60
+
+# /_metrics, /_logs, /_pool and /_cache show internals to anyone who asks.
+# Outside debug mode they answer 404 unless DEBUG_ENDPOINTS is set, which
+# should only be done where the public can't reach them.
+DEBUG_ENDPOINTS = os.environ.get('DEBUG_ENDPOINTS', '') == '1'
@@ -0,0 +1,64 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from models import db, Venue, Artist, Show
+from cache import cache
+import areas
+
+# Venue and Artist carry upcoming_show_count, past_show_count and
+# next_show_at so listings can show activity without aggregating shows per
+# row. Writes recompute them for the entities they touch, in the same
+# transaction; `flask roll-forward-shows`, run every few minutes, refreshes
+# the entities whose next show has started since.
+
+OWNER_KEYS = {Venue: Show.venue_id, Artist: Show.artist_id}
+
+def summary(model):
+    # Column -> correlated subquery recomputing it from the Show indexes
+    key = OWNER_KEYS[model]
+    now = func.now()
+    def shows(column, *criteria):
+        return db.session.query(column).filter(key == model.id, *criteria).correlate(model).as_scalar()
+    return {
+        model.upcoming_show_count: shows(func.count(Show.id), Show.start_time >= now),
+        model.past_show_count: shows(func.count(Show.id), Show.start_time < now),
+        model.next_show_at: shows(func.min(Show.start_time), Show.start_time >= now),
+    }
+
+def refresh(model, ids):
+    ids = set(ids) - {None}
+    if ids:
+        db.session.query(model).filter(model.id.in_(ids)) \
+            .update(summary(model), synchronize_session=False)
+        if model is Venue:
+            areas.refresh(areas.of_venues(ids), genres=False)
+
+def refresh_all():
+    # Recomputes every venue and artist and every area; after bulk loads
+    for model in (Venue, Artist):
+        db.session.query(model).update(summary(model), synchronize_session=False)
+    areas.rebuild()
+
+def roll_forward():
+    # Refreshes every venue and artist whose next show has started; returns
+    # the ids of each it touched
+    rolled = {}
+    for model in (Venue, Artist):
+        ids = [id for (id,) in db.session.query(model.id).filter(model.next_show_at <= func.now())]
+        refresh(model, ids)
+        rolled[model] = ids
+    return rolled
+
+
+@click.command('roll-forward-shows')
+@with_appcontext
+def roll_forward_command():
+    """Move shows that have started from the upcoming to the past counters."""
+    rolled = roll_forward()
+    db.session.commit()
+    if rolled[Venue]:
+        cache.invalidate('venues', *[f'venue:{id}' for id in rolled[Venue]])
+    if rolled[Artist]:
+        cache.invalidate('artists', *[f'artist:{id}' for id in rolled[Artist]])
+    click.echo(f'Rolled forward {len(rolled[Venue])} venues and {len(rolled[Artist])} artists')
@@ -0,0 +1,133 @@
+import random
+import threading
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, orm
+from sqlalchemy.pool import QueuePool
+
+# Pool settings come from SQLALCHEMY_ENGINE_OPTIONS (see config.py). Sessions
+# are removed by Flask-SQLAlchemy's teardown_appcontext handler at the end of
+# every request, which returns the connection to the pool, so views never
+# close the session themselves.
+
+class PoolStats:
+    # Counters shared by every engine of the process
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def waited(self, seconds):
+        with self.lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool recording how long each checkout waited for a free connection
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.count('timeouts')
+            raise
+        finally:
+            pool_stats.waited(time.perf_counter() - started)
+
+
+# Binds whose key starts with 'replica' (see SQLALCHEMY_BINDS in config.py)
+# are read replicas of the primary database. GET and HEAD requests read from
+# one of them, chosen once per request; everything else, including CLI
+# commands, uses the primary. After a request commits a write, the visitor
+# reads from the primary for REPLICA_STICKY_SECONDS so they see their own
+# changes despite replication lag.
+REPLICA_PREFIX = 'replica'
+
+def replica_keys(app):
+    return sorted(key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+        if key.startswith(REPLICA_PREFIX))
+
+def reads_from_replica():
+    return has_request_context() and request.method in ('GET', 'HEAD') \
+        and session.get('_primary_until', 0) < time.time()
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        self.replica = None
+        SignallingSession.__init__(self, db, **options)
+        event.listen(self, 'after_commit', self.mark_written)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or not reads_from_replica():
+            return SignallingSession.get_bind(self, mapper, clause)
+        if self.replica is None:
+            keys = replica_keys(self.app)
+            if not keys:
+                return SignallingSession.get_bind(self, mapper, clause)
+            self.replica = random.choice(keys)
+        return self.db.get_engine(self.app, bind=self.replica)
+
+    def mark_written(self, _):
+        if has_request_context() and request.method not in ('GET', 'HEAD'):
+            g.wrote_primary = True
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    def init_app(self, app):
+        super().init_app(app)
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get('wrote_primary') and replica_keys(app):
+                session['_primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+            return response
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        if sa_url.drivername.startswith('sqlite'):
+            # SQLite keeps the pool Flask-SQLAlchemy picks for it and has no
+            # server-side statement timeout
+            engine_opts = {key: value for key, value in engine_opts.items()
+                if key not in ('pool_size', 'max_overflow', 'pool_timeout', 'connect_args')}
+        else:
+            engine_opts.setdefault('poolclass', TimedQueuePool)
+        engine = super().create_engine(sa_url, engine_opts)
+        event.listen(engine, 'checkout', lambda *args: pool_stats.count('checkouts'))
+        event.listen(engine, 'checkin', lambda *args: pool_stats.count('checkins'))
+        return engine
+
+    def pool_status(self):
+        pool = self.engine.pool
+        status = {
+            'pool': type(pool).__name__,
+            'checkouts': pool_stats.checkouts,
+            'checkins': pool_stats.checkins,
+            'timeouts': pool_stats.timeouts,
+            'wait_total': round(pool_stats.wait_total, 6),
+            'wait_max': round(pool_stats.wait_max, 6),
+        }
+        if isinstance(pool, QueuePool):
+            status.update(size=pool.size(), checked_out=pool.checkedout(),
+                overflow=pool.overflow(), idle=pool.checkedin())
+        else:
+            status['checked_out'] = pool_stats.checkouts - pool_stats.checkins
+        return status
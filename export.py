@@ -0,0 +1,127 @@
+import csv
+import io
+import json
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+
+from models import db, Venue, Artist, Show, VenueGenre, ArtistGenre
+
+# Streams the catalogue as NDJSON or CSV for the /api/v1 endpoints and the
+# `flask export` command. Rows come from a server-side cursor (yield_per) and
+# are written as they arrive, so memory stays flat whatever the table size.
+# Field names follow the detail page dicts; only the requested fields are
+# selected.
+
+CHUNK_SIZE = 1000
+
+def fields_for(kind):
+    # Field name -> column expression; 'genres' is loaded separately
+    if kind == 'shows':
+        return {
+            'id': Show.id,
+            'venue_id': Show.venue_id,
+            'venue_name': Venue.name,
+            'artist_id': Show.artist_id,
+            'artist_name': Artist.name,
+            'artist_image_link': Artist.image_link,
+            'start_time': Show.start_time,
+        }
+    model = Venue if kind == 'venues' else Artist
+    names = ['id', 'name', 'city', 'state', 'address', 'phone', 'image_link', 'facebook_link',
+        'website_link', 'seeking_talent', 'seeking_venue', 'seeking_description']
+    fields = {name: getattr(model, name) for name in names if hasattr(model, name)}
+    fields['genres'] = None
+    fields['upcoming_shows_count'] = model.upcoming_show_count
+    fields['past_shows_count'] = model.past_show_count
+    return fields
+
+def parse_fields(kind, fields):
+    # Returns the requested field names in order, or raises ValueError
+    available = fields_for(kind)
+    if not fields:
+        return [name for name in available if not name.endswith('_count')]
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f'unknown field(s) {", ".join(unknown)}; available: {", ".join(available)}')
+    return names
+
+def iter_records(kind, names, genre=None):
+    # Yields one dict per row with exactly the requested fields
+    fields = fields_for(kind)
+    columns = [fields['id'].label('id')] + \
+        [fields[name].label(name) for name in names if name not in ('id', 'genres')]
+    query = db.session.query(*columns)
+    if kind == 'shows':
+        # A show's genres are its artist's
+        query = query.join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+        query = Artist.with_genre(query, genre).order_by(Show.start_time, Show.id)
+    else:
+        model = Venue if kind == 'venues' else Artist
+        query = model.with_genre(query, genre).order_by(model.id)
+    query = query.execution_options(stream_results=True).yield_per(CHUNK_SIZE)
+
+    chunk = []
+    for row in query:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            yield from emit_chunk(kind, names, chunk)
+            chunk = []
+    yield from emit_chunk(kind, names, chunk)
+
+def emit_chunk(kind, names, chunk):
+    genres = {}
+    if 'genres' in names and chunk:
+        genre_model, key = (VenueGenre, 'venue_id') if kind == 'venues' else (ArtistGenre, 'artist_id')
+        owner = getattr(genre_model, key)
+        # Rows arrive ordered by id, so the chunk's genres are one index range
+        for owner_id, genre in db.session.query(owner, genre_model.genre) \
+                .filter(owner.between(chunk[0].id, chunk[-1].id)).order_by(owner, genre_model.genre):
+            genres.setdefault(owner_id, []).append(genre)
+    for row in chunk:
+        record = {}
+        for name in names:
+            record[name] = genres.get(row.id, []) if name == 'genres' else getattr(row, name)
+        yield record
+
+def to_ndjson(records):
+    for record in records:
+        yield json.dumps(record, default=lambda value: value.isoformat()
+            if isinstance(value, datetime) else str(value)) + '\n'
+
+def to_csv(names, records):
+    # Genres are joined with commas, the form `flask import` reads back
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for record in records:
+        writer.writerow([','.join(value) if isinstance(value, list)
+            else value.isoformat(sep=' ') if isinstance(value, datetime)
+            else value for value in (record[name] for name in names)])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def stream(kind, format='ndjson', fields=None, genre=None):
+    names = parse_fields(kind, fields)
+    records = iter_records(kind, names, genre)
+    if format == 'csv':
+        return to_csv(names, records)
+    return to_ndjson(records)
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(['artists', 'shows', 'venues']))
+@click.option('--format', 'format', type=click.Choice(['ndjson', 'csv']), default='ndjson', show_default=True)
+@click.option('--fields', help='Comma-separated field names; defaults to every field but the show counts.')
+@click.option('--output', type=click.File('w'), default='-', help='Defaults to stdout.')
+@with_appcontext
+def export_command(kind, format, fields, output):
+    """Stream venues, artists or shows as NDJSON or CSV."""
+    try:
+        chunks = stream(kind, format, fields)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--fields')
+    for chunk in chunks:
+        output.write(chunk)
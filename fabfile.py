@@ -7,7 +7,9 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python benchmarks/query_plans.py && python benchmarks/pool_leaks.py --requests 1000"
+            " && python benchmarks/routes.py --shows 1000 --requests 5 --output /dev/null",
+            capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -40,7 +42,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python benchmarks/query_plans.py"
     )
 
 
@@ -0,0 +1,80 @@
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import MemoryBackend, FileSystemBackend
+
+# Rendered template fragments, cached under the values that determine them:
+#
+#   {% cache show.id, show.updated_at, show.artist_updated_at %}...{% endcache %}
+#
+# The key also holds the template and line of the block and the RELEASE, so
+# a deploy never serves markup from older templates. Since every input is in
+# the key nothing is invalidated; entries for old versions age out of the
+# bounded backend.
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [nodes.Const(f'{parser.name}:{lineno}'), parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body) \
+            .set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        store = self.environment.fragment_cache
+        if store is None or store.backend is None:
+            return caller()
+        key = '|'.join([store.release] + [str(part) for part in parts])
+        body = store.backend.get(key)
+        if body is None:
+            body = str(caller())
+            store.backend.set(key, body)
+        return Markup(body)
+
+
+class FragmentStore:
+    # One app's backend and RELEASE
+    def __init__(self, backend, release):
+        self.backend = backend
+        self.release = release
+
+
+class FragmentCache:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('FRAGMENT_CACHE_TYPE', 'memory')
+        max_entries = app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+        ttl = app.config.get('FRAGMENT_CACHE_TTL', 86400)
+        if cache_type == 'filesystem':
+            backend = FileSystemBackend(app.config['FRAGMENT_CACHE_DIR'], max_entries, ttl)
+        elif cache_type == 'memory':
+            backend = MemoryBackend(max_entries, ttl)
+        else:
+            backend = None
+        store = FragmentStore(backend, app.config.get('RELEASE', ''))
+        app.extensions['fragment_cache'] = store
+        # Each app has its own Jinja environment, which the tag reads from
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = store
+
+    def stats(self):
+        store = current_app.extensions.get('fragment_cache')
+        if store is None or store.backend is None:
+            return {}
+        return dict(store.backend.stats)
+
+
+fragments = FragmentCache()
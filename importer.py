@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, text
+from werkzeug.datastructures import MultiDict
+from wtforms.validators import DataRequired
+
+from forms import VenueForm, ArtistForm, ShowForm
+from models import db, Venue, Artist, Show, VenueGenre, ArtistGenre
+from cache import cache
+from booking import check as check_bookings
+import counters
+import areas
+
+# `flask import venues venues.csv` loads a CSV or NDJSON file in batches.
+# Every row is validated by the same form the web handlers use; rows that
+# fail are written to a rejects file instead of aborting the load. After
+# each committed batch the line reached is saved to a checkpoint file, so an
+# interrupted import picks up where it stopped when run again. Show start
+# times are read as UTC, as everywhere else.
+
+IMPORTS = {
+    # kind: (model, form, genre model, genre foreign key)
+    'venues': (Venue, VenueForm, VenueGenre, 'venue_id'),
+    'artists': (Artist, ArtistForm, ArtistGenre, 'artist_id'),
+    'shows': (Show, ShowForm, None, None),
+}
+
+BOOLEAN_FIELDS = ('seeking_talent', 'seeking_venue')
+FALSE_VALUES = ('', '0', 'false', 'no', 'n', 'f', 'off')
+
+def read_rows(path, format):
+    # Yields (line number, row dict or None, parse error or None)
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'csv':
+            for line_no, row in enumerate(csv.DictReader(f), start=2):
+                yield line_no, row, None
+        else:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_no, None, str(e)
+                    continue
+                if isinstance(row, dict):
+                    yield line_no, row, None
+                else:
+                    yield line_no, None, 'expected a JSON object'
+
+def to_formdata(row):
+    formdata = MultiDict()
+    for key, value in row.items():
+        if value is None or key is None:
+            continue
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(',') if genre.strip()]
+        if key in BOOLEAN_FIELDS:
+            if str(value).strip().lower() in FALSE_VALUES:
+                continue
+            value = 'y'
+        for item in value if isinstance(value, list) else [value]:
+            formdata.add(key, str(item))
+    return formdata
+
+def validate(form_class, row):
+    # Returns (form data, None) for a valid row or (None, errors)
+    formdata = to_formdata(row)
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    valid = form.validate()
+    # A missing column would silently take the field default (start_time
+    # defaults to today), so required fields must be present
+    errors = dict(form.errors)
+    for name, field in form._fields.items():
+        if name not in formdata and any(isinstance(v, DataRequired) for v in field.validators):
+            errors.setdefault(name, ['This field is required.'])
+    if not valid or errors:
+        return None, errors
+    data = {name: field.data for name, field in form._fields.items() if name != 'csrf_token'}
+    return data, None
+
+
+class ReferenceResolver:
+    # Maps the artist/venue of a show row to an existing id, accepting either
+    # an id or an exact name. Lookups are done per batch, not per row.
+    def __init__(self):
+        self.ids = {Artist: set(), Venue: set()}
+        self.names = {Artist: {}, Venue: {}}
+
+    def prefetch(self, rows):
+        for model, prefix in ((Artist, 'artist'), (Venue, 'venue')):
+            ids = {int(row[prefix + '_id']) for row in rows
+                if str(row.get(prefix + '_id') or '').strip().isdigit()} - self.ids[model]
+            names = {row[prefix + '_name'] for row in rows
+                if row.get(prefix + '_name') and not row.get(prefix + '_id')} - set(self.names[model])
+            if ids:
+                self.ids[model].update(id for (id,) in
+                    db.session.query(model.id).filter(model.id.in_(ids)))
+            if names:
+                for id, name in db.session.query(model.id, model.name).filter(model.name.in_(names)) \
+                        .order_by(model.id):
+                    self.names[model].setdefault(name, id)
+
+    def resolve(self, model, prefix, row):
+        value = str(row.get(prefix + '_id') or '').strip()
+        if value:
+            return int(value) if value.isdigit() and int(value) in self.ids[model] else None
+        return self.names[model].get(row.get(prefix + '_name'))
+
+
+def allocate_ids(model, count):
+    # Ids are assigned up front so genre rows can reference them without
+    # reading the inserted rows back
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text(
+            f"SELECT nextval(pg_get_serial_sequence('\"{model.__tablename__}\"', 'id')) "
+            "FROM generate_series(1, :count)"), {'count': count})
+        return [row[0] for row in rows]
+    start = db.session.query(func.coalesce(func.max(model.id), 0)).scalar() + 1
+    return list(range(start, start + count))
+
+def write_rows(table, rows):
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')',
+            buffer)
+    else:
+        db.session.execute(table.insert(), rows)
+
+def insert_batch(kind, records):
+    model, _, genre_model, genre_key = IMPORTS[kind]
+    now = datetime.utcnow()
+    if genre_model is None:
+        for record in records:
+            record['updated_at'] = now
+        write_rows(model.__table__, records)
+        counters.refresh(Venue, {record['venue_id'] for record in records})
+        counters.refresh(Artist, {record['artist_id'] for record in records})
+        cache.invalidate('shows', 'venues',
+            *{f'venue:{record["venue_id"]}' for record in records},
+            *{f'artist:{record["artist_id"]}' for record in records})
+        return
+    genre_rows = []
+    for id, record in zip(allocate_ids(model, len(records)), records):
+        record['id'] = id
+        record['updated_at'] = now
+        genre_rows.extend({genre_key: id, 'genre': genre} for genre in sorted(set(record.pop('genres'))))
+    write_rows(model.__table__, records)
+    write_rows(genre_model.__table__, genre_rows)
+    if model is Venue:
+        areas.refresh({(record['state'], record['city']) for record in records})
+    cache.invalidate(kind)
+
+def load_checkpoint(path, source):
+    if not path or not os.path.exists(path):
+        return {'source': source, 'line': 0, 'inserted': 0, 'rejected': 0}
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('source') != source:
+        raise click.ClickException(f'{path} is a checkpoint for {checkpoint.get("source")}, not {source}')
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    if path:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(path + '.tmp', path)
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']),
+    help='Defaults to the file extension.')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--checkpoint', 'checkpoint_path', type=click.Path(dir_okay=False),
+    help='File recording progress; an existing one resumes the import.')
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False),
+    help='NDJSON file receiving invalid rows. Defaults to PATH.rejects.ndjson.')
+@with_appcontext
+def import_command(kind, path, format, batch_size, checkpoint_path, rejects_path):
+    """Bulk load venues, artists or shows from a CSV or NDJSON file."""
+    format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    rejects_path = rejects_path or path + '.rejects.ndjson'
+    model, form_class, _, _ = IMPORTS[kind]
+    checkpoint = load_checkpoint(checkpoint_path, os.path.abspath(path))
+    resolver = ReferenceResolver() if model is Show else None
+    started = time.perf_counter()
+    inserted = rejected = 0
+    resumed = dict(checkpoint)
+
+    with open(rejects_path, 'a' if checkpoint['line'] else 'w') as rejects:
+        def reject(line_no, row, errors):
+            rejects.write(json.dumps({'line': line_no, 'errors': errors, 'row': row}, default=str) + '\n')
+
+        def flush(batch, last_line):
+            # Rejects are written once the whole batch is checked, in line
+            # order whichever check caught them
+            nonlocal inserted, rejected
+            if resolver:
+                resolver.prefetch([row for _, row, error in batch if not error])
+            records = []
+            failed = []
+            for line_no, row, error in batch:
+                if error:
+                    failed.append((line_no, None, {'row': [error]}))
+                    continue
+                data, errors = validate(form_class, row)
+                if data and resolver:
+                    data['artist_id'] = resolver.resolve(Artist, 'artist', row)
+                    data['venue_id'] = resolver.resolve(Venue, 'venue', row)
+                    errors = {prefix: ['unknown ' + prefix] for prefix in ('artist_id', 'venue_id')
+                        if data[prefix] is None} or None
+                if errors:
+                    failed.append((line_no, row, errors))
+                else:
+                    records.append((line_no, row, data))
+            if resolver:
+                # Shows overlapping one already booked, or another in this
+                # batch, are rejected like invalid rows
+                conflicts = check_bookings([data for _, _, data in records])
+                failed.extend((line_no, row, errors)
+                    for (line_no, row, _), errors in zip(records, conflicts) if errors)
+                records = [record for record, errors in zip(records, conflicts) if not errors]
+            for line_no, row, errors in sorted(failed, key=lambda failure: failure[0]):
+                reject(line_no, row, errors)
+            rejected += len(failed)
+            records = [data for _, _, data in records]
+            try:
+                insert_batch(kind, records)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            inserted += len(records)
+            rejects.flush()
+            checkpoint.update(line=last_line, inserted=resumed['inserted'] + inserted,
+                rejected=resumed['rejected'] + rejected)
+            save_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time.perf_counter() - started
+            click.echo(f'line {last_line}: {inserted} inserted, {rejected} rejected, '
+                f'{(inserted + rejected) / elapsed:.0f} rows/sec')
+
+        batch = []
+        last_line = checkpoint['line']
+        for line_no, row, error in read_rows(path, format):
+            if line_no <= checkpoint['line']:
+                continue
+            last_line = line_no
+            batch.append((line_no, row, error))
+            if len(batch) >= batch_size:
+                flush(batch, last_line)
+                batch = []
+        if batch or last_line > checkpoint['line']:
+            flush(batch, last_line)
+
+    elapsed = time.perf_counter() - started
+    click.echo(f'Imported {inserted} {kind} in {elapsed:.1f}s '
+        f'({(inserted + rejected) / max(elapsed, 1e-9):.0f} rows/sec); {rejected} rejected')
+    if rejected:
+        click.echo(f'Rejected rows written to {rejects_path}')
@@ -0,0 +1,258 @@
+import atexit
+import collections
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Logging that never blocks a request thread on I/O. The app logger hands
+# records to a bounded queue, dropping them when it is full, and a listener
+# thread writes them as JSON lines to LOG_FILE (stderr in debug mode or when
+# it is empty) and keeps the last LOG_BUFFER_SIZE for /_logs. Records logged
+# during a request carry its method, path, route, view args (the venue or
+# artist id), and the time and SQL statements it had taken so far; with
+# LOG_REQUESTS each request logs one such record as it ends. An error logged
+# again from the same place with the same exception type is let through once
+# per LOG_ERROR_WINDOW seconds, and the next one let through counts those
+# suppressed meanwhile, so a database outage does not flood the log.
+
+def payload(record):
+    # The JSON document of a record; built in the thread that logged it, as
+    # the request it describes is only reachable from there
+    document = {
+        'time': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+        'level': record.levelname,
+        'logger': record.name,
+        'message': record.getMessage(),
+    }
+    if record.exc_info and record.exc_info[0] is not None:
+        document['error'] = {
+            'type': record.exc_info[0].__name__,
+            'message': str(record.exc_info[1]),
+            'traceback': ''.join(traceback.format_exception(*record.exc_info)),
+        }
+    document.update(getattr(record, 'fields', {}))
+    if getattr(record, 'suppressed', 0):
+        document['suppressed'] = record.suppressed
+    if has_request_context():
+        document['request'] = request_fields()
+    return document
+
+def request_fields():
+    fields = {
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'endpoint': request.endpoint,
+    }
+    if request.view_args:
+        fields['args'] = request.view_args
+    if 'log_started' in g:
+        fields['duration_ms'] = round((time.perf_counter() - g.log_started) * 1000, 2)
+        fields['queries'] = g.log_queries
+    return fields
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        document = getattr(record, 'payload', None) or payload(record)
+        return json.dumps(document, default=str)
+
+
+class ErrorLimiter(logging.Filter):
+    # Lets each (exception type, file, line) of ERROR and above through once
+    # per window seconds
+    MAX_KEYS = 1024
+
+    def __init__(self, window=60):
+        super().__init__()
+        self.window = window
+        self.lock = threading.Lock()
+        # key -> [window start, suppressed in it]; oldest windows first
+        self.windows = collections.OrderedDict()
+        self.suppressed = collections.Counter()
+
+    def filter(self, record):
+        if record.levelno < logging.ERROR:
+            return True
+        error = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (error, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            state = self.windows.get(key)
+            if state is not None and now - state[0] < self.window:
+                state[1] += 1
+                self.suppressed[key] += 1
+                return False
+            if state is not None:
+                record.suppressed = state[1]
+                del self.windows[key]
+            self.windows[key] = [now, 0]
+            while len(self.windows) > self.MAX_KEYS:
+                self.windows.popitem(last=False)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return [{'error': error, 'at': f'{os.path.basename(path)}:{line}', 'suppressed': count}
+                for (error, path, line), count in self.suppressed.most_common(20)]
+
+
+class RingBuffer(logging.Handler):
+    def __init__(self, capacity=1000):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(getattr(record, 'payload', None) or payload(record))
+
+    def latest(self, level=logging.NOTSET, limit=None):
+        # Newest first
+        records = [record for record in reversed(list(self.records))
+            if logging.getLevelName(record['level']) >= level]
+        return records[:limit]
+
+
+class StructuredQueueHandler(QueueHandler):
+    def __init__(self, logs, queue):
+        super().__init__(queue)
+        self.logs = logs
+
+    def prepare(self, record):
+        # A copy without the traceback objects or arguments, which other
+        # threads may still be changing
+        document = payload(record)
+        record = copy.copy(record)
+        record.payload = document
+        record.msg = document['message']
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def enqueue(self, record):
+        self.logs.listen()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.logs.dropped += 1
+
+
+class AppHandler(logging.Handler):
+    # app.logger is shared by every app of the same name, so it gets one of
+    # these, which hands each record to the logs of the app it was logged
+    # in, or outside any app context to those of the app set up last
+    def __init__(self, logs):
+        super().__init__()
+        self.logs = logs
+
+    def handle(self, record):
+        logs = current_app.extensions.get('logs') if has_app_context() else None
+        return (logs or self.logs).handler.handle(record)
+
+
+class AppLogs:
+    # One app's queue, listener thread, sinks, error limiter and buffer,
+    # kept in app.extensions so that setting up another app leaves them as
+    # they were
+    def __init__(self, app, level):
+        self.listener = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.queue_size = app.config.get('LOG_QUEUE_SIZE', 10000)
+        self.limiter = ErrorLimiter(app.config.get('LOG_ERROR_WINDOW', 60))
+        self.buffer = RingBuffer(app.config.get('LOG_BUFFER_SIZE', 1000))
+        log_file = app.config.get('LOG_FILE')
+        sink = logging.FileHandler(log_file, delay=True) if log_file and not app.debug else logging.StreamHandler(sys.stderr)
+        sink.setFormatter(JsonFormatter())
+        self.sinks = [sink, self.buffer]
+        self.handler = StructuredQueueHandler(self, queue.Queue(self.queue_size))
+        self.handler.setLevel(level)
+        self.handler.addFilter(self.limiter)
+
+    def listen(self):
+        # The listener thread does not survive a fork, so each process starts
+        # its own, on a fresh queue, with the first record it logs
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.handler.queue = queue.Queue(self.queue_size)
+                self.listener = QueueListener(self.handler.queue, *self.sinks)
+                self.listener.start()
+                self.pid = os.getpid()
+
+    def stop(self):
+        # Writes out what is queued; at exit, and before the app is set up again
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+        self.listener = None
+        self.pid = None
+
+    def stats(self, level=logging.NOTSET, limit=None):
+        return {
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.dropped,
+            'suppressed': self.limiter.stats(),
+            'records': self.buffer.latest(level, limit),
+        }
+
+
+class Logs:
+    def init_app(self, app):
+        level = logging.getLevelName(app.config.get('LOG_LEVEL', 'INFO'))
+        previous = app.extensions.get('logs')
+        if previous is not None:
+            previous.stop()
+        state = app.extensions['logs'] = AppLogs(app, level)
+        atexit.register(state.stop)
+
+        app.logger.removeHandler(default_handler)
+        handlers = [handler for handler in app.logger.handlers if isinstance(handler, AppHandler)]
+        if handlers:
+            # Low enough for every app sharing the logger; each app's own
+            # handler drops what is below its level
+            handlers[0].logs = state
+            app.logger.setLevel(min(app.logger.level or level, level))
+        else:
+            app.logger.addHandler(AppHandler(state))
+            app.logger.setLevel(level)
+
+        if app.config.get('LOG_REQUESTS', False):
+            app.before_request(self.start)
+            app.after_request(self.finish)
+        if not event.contains(Engine, 'after_cursor_execute', self.count_query):
+            event.listen(Engine, 'after_cursor_execute', self.count_query)
+
+    def start(self):
+        g.log_started = time.perf_counter()
+        g.log_queries = 0
+
+    def count_query(self, *args):
+        if has_request_context() and 'log_started' in g:
+            g.log_queries += 1
+
+    def finish(self, response):
+        if 'log_started' in g:
+            current_app.logger.getChild('requests').info(f'{request.method} {request.path} {response.status_code}',
+                extra={'fields': {'status': response.status_code}})
+        return response
+
+    def stats(self, level=logging.NOTSET, limit=None):
+        # The current app's
+        return current_app.extensions['logs'].stats(level, limit)
+
+
+logs = Logs()
@@ -0,0 +1,178 @@
+import threading
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from heapq import nlargest
+from sqlalchemy import func
+
+from models import db, Venue, Artist, Show, VenueGenre, ArtistGenre
+from suggest import SyncedIndexes
+
+# Suggested venues for an artist and artists for a venue, among the venues
+# seeking talent and the artists seeking venues. Each worker holds, per kind,
+# the seeking candidates and inverted indexes from each genre, state and
+# (state, city) to their ids; a lookup only counts through the postings of
+# the subject's genres and area, never the whole catalogue. Candidates share
+# at least one genre with the subject (any, when it has none) and score
+#   2 per shared genre + 2 for the same city or 1 for the same state
+#   + activity
+# where activity, below 1, grows with their shows over RECENT and only breaks
+# ties. The create, edit and delete handlers update the local indexes; other
+# workers catch up every MATCH_SYNC_SECONDS through updated_at, as the
+# typeahead's do, and booking a show stamps both sides.
+
+RECENT = timedelta(days=365)
+# search() prunes on the assumption that it is 2
+GENRE_WEIGHT = 2
+
+Candidate = namedtuple('Candidate', 'name city state image_link genres activity')
+
+def activity(shows):
+    return shows / (shows + 4)
+
+
+class MatchIndex:
+    def __init__(self, candidates=()):
+        self.lock = threading.Lock()
+        self.candidates = {}
+        # key -> frozenset of ids; writes replace a whole set, so lookups
+        # read them without a lock
+        self.by_genre = {}
+        self.by_state = {}
+        self.by_area = {}
+        self.update(dict(candidates))
+
+    @staticmethod
+    def keys(candidate):
+        # (postings attribute, key) pairs a candidate is filed under
+        return [('by_genre', genre) for genre in candidate.genres] + [
+            ('by_state', candidate.state), ('by_area', (candidate.state, candidate.city))]
+
+    def update(self, changes):
+        # changes maps ids to their Candidate, or to None to drop them; each
+        # posting set touched is copied once for the whole batch
+        with self.lock:
+            added, removed = {}, {}
+            for id, candidate in changes.items():
+                old = self.candidates.pop(id, None)
+                if old is not None:
+                    for key in self.keys(old):
+                        removed.setdefault(key, set()).add(id)
+                if candidate is not None:
+                    self.candidates[id] = candidate
+                    for key in self.keys(candidate):
+                        added.setdefault(key, set()).add(id)
+            for key in added.keys() | removed.keys():
+                postings = getattr(self, key[0])
+                ids = (postings.get(key[1], frozenset()) - removed.get(key, set())) | added.get(key, set())
+                if ids:
+                    postings[key[1]] = frozenset(ids)
+                else:
+                    postings.pop(key[1], None)
+
+    def search(self, genres, state, city, limit, exclude=()):
+        genres = set(genres)
+        shared = Counter()
+        for genre in genres:
+            shared.update(self.by_genre.get(genre, ()))
+        # 1 for the same state, 2 for the same city
+        location = Counter(self.by_state.get(state, ()))
+        location.update(self.by_area.get((state, city), ()))
+        for id in exclude:
+            shared.pop(id, None)
+            location.pop(id, None)
+        if genres:
+            # Each of the top limit scores at least GENRE_WEIGHT * floor, floor
+            # being the limit-th largest number of shared genres. Sharing one
+            # fewer, only the same city can reach it, and none sharing less,
+            # so the rest are never scored.
+            floor = min(nlargest(limit, shared.values()), default=0)
+            pool = [id for id, count in shared.items() if count >= floor]
+            pool.extend(id for id, score in location.items() if score == 2 and shared.get(id) == floor - 1)
+        else:
+            pool = location
+        candidates = self.candidates
+        scored = []
+        for id in pool:
+            candidate = candidates.get(id)
+            if candidate is not None:
+                scored.append((GENRE_WEIGHT * shared.get(id, 0) + location.get(id, 0) + candidate.activity, id))
+        results = []
+        for score, id in nlargest(limit, scored):
+            candidate = candidates[id]
+            results.append({
+                'id': id,
+                'name': candidate.name,
+                'city': candidate.city,
+                'state': candidate.state,
+                'image_link': candidate.image_link,
+                'shared_genres': sorted(genres.intersection(candidate.genres)),
+                'score': round(score, 2)
+            })
+        return results
+
+    def __len__(self):
+        return len(self.candidates)
+
+
+class Matches(SyncedIndexes):
+    SYNC_SETTING = 'MATCH_SYNC_SECONDS'
+    EXTENSION = 'matches'
+    SEEKING = {'artists': Artist.seeking_venue, 'venues': Venue.seeking_talent}
+    GENRES = {'artists': (ArtistGenre.artist_id, ArtistGenre.genre), 'venues': (VenueGenre.venue_id, VenueGenre.genre)}
+    SHOW_KEYS = {'artists': Show.artist_id, 'venues': Show.venue_id}
+
+    def candidates(self, kind, rows):
+        # rows of (id, name, city, state, image_link, seeking, ...) -> {id:
+        # Candidate or None when not seeking}, with their genres and recent
+        # shows read in one query each
+        seeking = [row[0] for row in rows if row[5]]
+        genres, shows = {}, {}
+        if seeking:
+            id_column, genre_column = self.GENRES[kind]
+            for id, genre in self.in_ids(db.session.query(id_column, genre_column), id_column, seeking):
+                genres.setdefault(id, []).append(genre)
+            key = self.SHOW_KEYS[kind]
+            query = db.session.query(key, func.count(Show.id)) \
+                .filter(Show.start_time >= datetime.utcnow() - RECENT).group_by(key)
+            shows = dict(self.in_ids(query, key, seeking))
+        return {row[0]: Candidate(row[1], row[2], row[3], row[4], tuple(genres.get(row[0], ())),
+            activity(shows.get(row[0], 0))) if row[5] else None for row in rows}
+
+    @staticmethod
+    def in_ids(query, column, ids):
+        # Batched so the IN lists stay short
+        for start in range(0, len(ids), 10000):
+            yield from query.filter(column.in_(ids[start:start + 10000]))
+
+    def columns(self, kind):
+        model = self.MODELS[kind]
+        return (model.id, model.name, model.city, model.state, model.image_link, self.SEEKING[kind])
+
+    def build(self, kind):
+        rows = db.session.query(*self.columns(kind)).filter(self.SEEKING[kind]).all()
+        return MatchIndex(self.candidates(kind, rows))
+
+    def changed(self, kind, query):
+        return query.with_entities(*self.columns(kind), self.MODELS[kind].updated_at).all()
+
+    def apply(self, kind, index, rows):
+        index.update(self.candidates(kind, rows))
+
+    def search(self, kind, subject, limit, exclude=()):
+        # Seeking candidates of kind for a venue or artist
+        return self.index(kind).search(subject.genres, subject.state, subject.city, limit, exclude)
+
+    def put(self, kind, entity):
+        # Nothing to update until this worker has loaded the index
+        index = self.loaded(kind)
+        if index is not None:
+            self.apply(kind, index, [(entity.id, entity.name, entity.city, entity.state,
+                entity.image_link, getattr(entity, self.SEEKING[kind].key))])
+
+    def remove(self, kind, id):
+        index = self.loaded(kind)
+        if index is not None:
+            index.update({id: None})
+
+
+matches = Matches()
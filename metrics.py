@@ -0,0 +1,235 @@
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from flask import current_app, g, has_request_context, request, signals_available, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Opt-in request instrumentation (INSTRUMENTATION=1). Every request records
+# its wall time, SQL statement count and time, template render time and,
+# with TRACE_ALLOCATIONS, peak traced memory. The numbers are sent back in a
+# Server-Timing header and aggregated per endpoint for /_metrics. With
+# PROFILE_SLOW_MS set, requests are sampled by a background thread and
+# those slower than the threshold are written to PROFILE_DIR as folded
+# stacks, ready for flamegraph.pl or speedscope.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Registry:
+    # Per (endpoint, method, status) totals and a duration histogram
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def observe(self, labels, timing):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {
+                    'count': 0, 'seconds': 0.0, 'sql_statements': 0, 'sql_seconds': 0.0,
+                    'template_seconds': 0.0, 'peak_bytes': 0, 'buckets': [0] * len(BUCKETS)}
+            series['count'] += 1
+            series['seconds'] += timing['total']
+            series['sql_statements'] += timing['sql_statements']
+            series['sql_seconds'] += timing['sql']
+            series['template_seconds'] += timing['template']
+            series['peak_bytes'] = max(series['peak_bytes'], timing.get('peak_bytes', 0))
+            for i, bound in enumerate(BUCKETS):
+                if timing['total'] <= bound:
+                    series['buckets'][i] += 1
+
+    def render(self):
+        # Prometheus text exposition format
+        with self.lock:
+            series = {labels: dict(values, buckets=list(values['buckets'])) for labels, values in self.series.items()}
+        lines = []
+        def metric(name, kind, help):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+        def label_text(labels, **extra):
+            endpoint, method, status = labels
+            pairs = dict(endpoint=endpoint or 'none', method=method, status=status, **extra)
+            return '{' + ','.join(f'{key}="{value}"' for key, value in pairs.items()) + '}'
+
+        metric('fyyur_request_duration_seconds', 'histogram', 'Request wall time.')
+        for labels, values in sorted(series.items()):
+            for bound, count in zip(BUCKETS, values['buckets']):
+                lines.append(f'fyyur_request_duration_seconds_bucket{label_text(labels, le=bound)} {count}')
+            lines.append(f'fyyur_request_duration_seconds_bucket{label_text(labels, le="+Inf")} {values["count"]}')
+            lines.append(f'fyyur_request_duration_seconds_sum{label_text(labels)} {values["seconds"]:.6f}')
+            lines.append(f'fyyur_request_duration_seconds_count{label_text(labels)} {values["count"]}')
+        for name, key, kind, help in (
+                ('fyyur_sql_statements_total', 'sql_statements', 'counter', 'SQL statements issued.'),
+                ('fyyur_sql_seconds_total', 'sql_seconds', 'counter', 'Time spent executing SQL.'),
+                ('fyyur_template_seconds_total', 'template_seconds', 'counter', 'Time spent rendering templates.'),
+                ('fyyur_request_peak_bytes', 'peak_bytes', 'gauge', 'Largest peak of traced allocations.')):
+            metric(name, kind, help)
+            for labels, values in sorted(series.items()):
+                value = values[key]
+                lines.append(f'{name}{label_text(labels)} {value:.6f}' if isinstance(value, float)
+                    else f'{name}{label_text(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class Sampler:
+    # One daemon thread sampling the stacks of the threads serving profiled
+    # requests every interval seconds
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = {}
+        self.thread = None
+
+    def start(self):
+        ident = threading.get_ident()
+        with self.lock:
+            self.active[ident] = collections.Counter()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='metrics-sampler', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            return self.active.pop(threading.get_ident(), collections.Counter())
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.active:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[self.collapse(frame)] += 1
+
+    @staticmethod
+    def collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+
+class AppMetrics:
+    # One app's settings and numbers, kept in app.extensions so that setting
+    # up another app leaves them as they were
+    def __init__(self, config):
+        self.registry = Registry()
+        self.sampler = Sampler()
+        self.profile_slow = config.get('PROFILE_SLOW_MS')
+        self.profile_dir = config.get('PROFILE_DIR')
+        self.trace_allocations = config.get('TRACE_ALLOCATIONS', False)
+
+    @property
+    def profiling(self):
+        return bool(self.profile_slow and self.profile_dir)
+
+
+class Instrumentation:
+    def init_app(self, app):
+        if not app.config.get('INSTRUMENTATION', False):
+            return
+        state = app.extensions['instrumentation'] = AppMetrics(app.config)
+        if state.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if state.profiling:
+            os.makedirs(state.profile_dir, exist_ok=True)
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        # after_request is skipped when a view raises
+        app.teardown_request(lambda exc: state.sampler.stop())
+        # Engines are created lazily (and once per replica), so listen on all
+        # and only once, however many apps are set up
+        for name, listener in (('before_cursor_execute', self.before_cursor_execute),
+                ('after_cursor_execute', self.after_cursor_execute)):
+            if not event.contains(Engine, name, listener):
+                event.listen(Engine, name, listener)
+        if signals_available:
+            before_render_template.connect(self.before_render, app)
+            template_rendered.connect(self.after_render, app)
+
+    @property
+    def state(self):
+        # The current app's, or None when it is not instrumented
+        return current_app.extensions.get('instrumentation')
+
+    def start(self):
+        state = self.state
+        g.timing = {'started': time.perf_counter(), 'sql_statements': 0, 'sql': 0.0,
+            'template': 0.0, 'templates': []}
+        if state.trace_allocations:
+            # Process wide: concurrent requests inflate each other's peak
+            tracemalloc.reset_peak()
+            g.timing['traced_before'] = tracemalloc.get_traced_memory()[0]
+        if state.profiling:
+            state.sampler.start()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'timing' in g:
+            context._metrics_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is not None and has_request_context() and 'timing' in g:
+            g.timing['sql_statements'] += 1
+            g.timing['sql'] += time.perf_counter() - started
+
+    def before_render(self, sender, template, context):
+        if 'timing' in g:
+            g.timing['templates'].append(time.perf_counter())
+
+    def after_render(self, sender, template, context):
+        if 'timing' in g and g.timing['templates']:
+            elapsed = time.perf_counter() - g.timing['templates'].pop()
+            # Nested renders are already part of the outer one
+            if not g.timing['templates']:
+                g.timing['template'] += elapsed
+
+    def finish(self, response):
+        timing = g.pop('timing', None)
+        if timing is None:
+            return response
+        state = self.state
+        timing['total'] = time.perf_counter() - timing['started']
+        if state.trace_allocations:
+            timing['peak_bytes'] = tracemalloc.get_traced_memory()[1] - timing['traced_before']
+        if state.profiling:
+            stacks = state.sampler.stop()
+            if timing['total'] * 1000 >= state.profile_slow and stacks:
+                self.dump(state.profile_dir, stacks, timing)
+        state.registry.observe((request.endpoint, request.method, str(response.status_code)), timing)
+        response.headers.add('Server-Timing', ', '.join([
+            f'total;dur={timing["total"] * 1000:.1f}',
+            f'sql;dur={timing["sql"] * 1000:.1f};desc="{timing["sql_statements"]} statements"',
+            f'template;dur={timing["template"] * 1000:.1f}',
+        ]))
+        return response
+
+    def render(self, **groups):
+        # Request metrics plus untyped samples for other numeric stats, e.g.
+        # render(pool={...}) gives fyyur_pool_checkouts
+        state = self.state
+        text = state.registry.render() if state is not None else ''
+        for group, stats in groups.items():
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    text += f'fyyur_{group}_{key} {value}\n'
+        return text
+
+    @staticmethod
+    def dump(directory, stacks, timing):
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{int(timing["total"] * 1000)}ms-{request.endpoint}.folded'
+        with open(os.path.join(directory, name), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+instrumentation = Instrumentation()
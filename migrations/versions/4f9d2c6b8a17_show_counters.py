@@ -0,0 +1,65 @@
+"""show counters
+
+Revision ID: 4f9d2c6b8a17
+Revises: e2b7a5c91f03
+Create Date: 2026-10-18 13:27:09.816204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f9d2c6b8a17'
+down_revision = 'e2b7a5c91f03'
+branch_labels = None
+depends_on = None
+
+
+# The name search triggers of the search_indexes revision
+SEARCH_TABLES = (('venue_search', 'Venue'), ('artist_search', 'Artist'))
+
+
+def search_triggers(fts, source):
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN '
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    ]
+
+
+def restore_search_triggers():
+    # SQLite batch mode rebuilds the table, which drops the FTS triggers
+    if op.get_bind().dialect.name == 'sqlite':
+        for fts, source in SEARCH_TABLES:
+            for statement in search_triggers(fts, source):
+                op.execute(statement)
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    for table, key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.add_column(table, sa.Column('upcoming_show_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_show_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(), nullable=True))
+        op.create_index(f'ix_{table}_next_show_at', table, ['next_show_at'], unique=False)
+        shows = f'FROM "Show" WHERE "Show".{key} = "{table}".id'
+        op.execute(
+            f'UPDATE "{table}" SET '
+            f'upcoming_show_count = (SELECT count(*) {shows} AND start_time >= CURRENT_TIMESTAMP), '
+            f'past_show_count = (SELECT count(*) {shows} AND start_time < CURRENT_TIMESTAMP), '
+            f'next_show_at = (SELECT min(start_time) {shows} AND start_time >= CURRENT_TIMESTAMP)')
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_next_show_at', table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('next_show_at')
+            batch_op.drop_column('past_show_count')
+            batch_op.drop_column('upcoming_show_count')
+    restore_search_triggers()
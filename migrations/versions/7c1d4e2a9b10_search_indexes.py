@@ -0,0 +1,62 @@
+"""search indexes
+
+Revision ID: 7c1d4e2a9b10
+Revises: 3981eae89c08
+Create Date: 2026-10-18 11:20:04.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d4e2a9b10'
+down_revision = '3981eae89c08'
+branch_labels = None
+depends_on = None
+
+# External-content FTS5 tables over the names, as search.py created them
+# at this revision; kept in sync with Venue and Artist by triggers
+SEARCH_TABLES = (('venue_search', 'Venue'), ('artist_search', 'Artist'))
+
+
+def search_triggers(fts, source):
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN '
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    ]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False,
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False,
+            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    else:
+        op.create_index('ix_Venue_name_trgm', 'Venue', ['name'], unique=False)
+        op.create_index('ix_Artist_name_trgm', 'Artist', ['name'], unique=False)
+    if dialect == 'sqlite':
+        for fts, source in SEARCH_TABLES:
+            op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                f"name, content='{source}', content_rowid='id', tokenize='trigram')")
+            for statement in search_triggers(fts, source):
+                op.execute(statement)
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for fts, _ in SEARCH_TABLES:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {fts}')
+    op.drop_index('ix_Artist_name_trgm', table_name='Artist')
+    op.drop_index('ix_Venue_name_trgm', table_name='Venue')
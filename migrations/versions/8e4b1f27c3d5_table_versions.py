@@ -0,0 +1,53 @@
+"""table versions
+
+Revision ID: 8e4b1f27c3d5
+Revises: 6d2a9c4e7f18
+Create Date: 2026-10-18 17:40:12.204719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b1f27c3d5'
+down_revision = '6d2a9c4e7f18'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show', 'venue_areas', 'venue_area_genres')
+
+
+def upgrade():
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO table_versions (name, version) VALUES "
+        "('Venue', 0), ('Artist', 0), ('Show', 0), ('venue_areas', 0), ('venue_area_genres', 0)")
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            'CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$ BEGIN '
+            'UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME; '
+            'RETURN NULL; END $$ LANGUAGE plpgsql')
+        for table in TABLES:
+            op.execute(f'CREATE TRIGGER "{table}_version" AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE '
+                f'ON "{table}" FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()')
+    elif op.get_bind().dialect.name == 'sqlite':
+        for table in TABLES:
+            for operation in ('INSERT', 'UPDATE', 'DELETE'):
+                op.execute(f'CREATE TRIGGER "{table}_version_{operation.lower()}" AFTER {operation} ON "{table}" '
+                    f"BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table in TABLES:
+            op.execute(f'DROP TRIGGER IF EXISTS "{table}_version" ON "{table}"')
+        op.execute('DROP FUNCTION IF EXISTS bump_table_version()')
+    elif op.get_bind().dialect.name == 'sqlite':
+        for table in TABLES:
+            for operation in ('insert', 'update', 'delete'):
+                op.execute(f'DROP TRIGGER IF EXISTS "{table}_version_{operation}"')
+    op.drop_table('table_versions')
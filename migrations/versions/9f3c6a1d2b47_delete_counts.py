@@ -0,0 +1,91 @@
+"""delete counts
+
+Revision ID: 9f3c6a1d2b47
+Revises: 8e4b1f27c3d5
+Create Date: 2026-10-18 19:05:41.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3c6a1d2b47'
+down_revision = '8e4b1f27c3d5'
+branch_labels = None
+depends_on = None
+
+VERSIONED = ('Venue', 'Artist', 'Show', 'venue_areas', 'venue_area_genres')
+TABLES = ('Venue', 'Artist', 'Show', 'venue_areas')
+
+
+def drop_version_triggers(dialect):
+    if dialect == 'postgresql':
+        for table in VERSIONED:
+            op.execute(f'DROP TRIGGER IF EXISTS "{table}_version" ON "{table}"')
+        op.execute('DROP FUNCTION IF EXISTS bump_table_version()')
+    elif dialect == 'sqlite':
+        for table in VERSIONED:
+            for operation in ('insert', 'update', 'delete'):
+                op.execute(f'DROP TRIGGER IF EXISTS "{table}_version_{operation}"')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    drop_version_triggers(dialect)
+    op.drop_table('table_versions')
+    op.create_index('ix_Show_updated_at', 'Show', ['updated_at'], unique=False)
+    op.create_index('ix_venue_areas_updated_at', 'venue_areas', ['updated_at'], unique=False)
+    op.create_table('delete_counts',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('deletes', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO delete_counts (name, deletes) VALUES "
+        "('Venue', 0), ('Artist', 0), ('Show', 0), ('venue_areas', 0)")
+    if dialect == 'postgresql':
+        op.execute(
+            'CREATE OR REPLACE FUNCTION count_deletes() RETURNS trigger AS $$ BEGIN '
+            'UPDATE delete_counts SET deletes = deletes + 1 WHERE name = TG_TABLE_NAME; '
+            'RETURN NULL; END $$ LANGUAGE plpgsql')
+        for table in TABLES:
+            op.execute(f'CREATE TRIGGER "{table}_deletes" AFTER DELETE OR TRUNCATE '
+                f'ON "{table}" FOR EACH STATEMENT EXECUTE PROCEDURE count_deletes()')
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            op.execute(f'CREATE TRIGGER "{table}_deletes" AFTER DELETE ON "{table}" '
+                f"BEGIN UPDATE delete_counts SET deletes = deletes + 1 WHERE name = '{table}'; END")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in TABLES:
+            op.execute(f'DROP TRIGGER IF EXISTS "{table}_deletes" ON "{table}"')
+        op.execute('DROP FUNCTION IF EXISTS count_deletes()')
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            op.execute(f'DROP TRIGGER IF EXISTS "{table}_deletes"')
+    op.drop_table('delete_counts')
+    op.drop_index('ix_venue_areas_updated_at', table_name='venue_areas')
+    op.drop_index('ix_Show_updated_at', table_name='Show')
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO table_versions (name, version) VALUES "
+        "('Venue', 0), ('Artist', 0), ('Show', 0), ('venue_areas', 0), ('venue_area_genres', 0)")
+    if dialect == 'postgresql':
+        op.execute(
+            'CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$ BEGIN '
+            'UPDATE table_versions SET version = version + 1 WHERE name = TG_TABLE_NAME; '
+            'RETURN NULL; END $$ LANGUAGE plpgsql')
+        for table in VERSIONED:
+            op.execute(f'CREATE TRIGGER "{table}_version" AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE '
+                f'ON "{table}" FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()')
+    elif dialect == 'sqlite':
+        for table in VERSIONED:
+            for operation in ('INSERT', 'UPDATE', 'DELETE'):
+                op.execute(f'CREATE TRIGGER "{table}_version_{operation.lower()}" AFTER {operation} ON "{table}" '
+                    f"BEGIN UPDATE table_versions SET version = version + 1 WHERE name = '{table}'; END")
@@ -0,0 +1,104 @@
+"""normalise genres
+
+Revision ID: a84f0c6d2e51
+Revises: 7c1d4e2a9b10
+Create Date: 2026-10-18 11:52:40.527183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import json
+
+
+# revision identifiers, used by Alembic.
+revision = 'a84f0c6d2e51'
+down_revision = '7c1d4e2a9b10'
+branch_labels = None
+depends_on = None
+
+ENTITIES = (
+    # (entity table, genre table, foreign key column)
+    ('Venue', 'venue_genres', 'venue_id'),
+    ('Artist', 'artist_genres', 'artist_id'),
+)
+
+
+def parse_genres(value):
+    # Rows were written with json.dumps, but older ones may hold a Postgres
+    # array literal such as {Jazz,"Rock n Roll"}
+    if not value:
+        return []
+    try:
+        genres = json.loads(value)
+    except ValueError:
+        genres = [genre.strip().strip('"') for genre in value.strip('{}').split(',')]
+    if isinstance(genres, str):
+        genres = [genres]
+    return sorted({genre for genre in genres if genre})
+
+
+# The name search triggers of the search_indexes revision
+SEARCH_TABLES = (('venue_search', 'Venue'), ('artist_search', 'Artist'))
+
+
+def search_triggers(fts, source):
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN '
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    ]
+
+
+def restore_search_triggers():
+    # SQLite batch mode rebuilds the table, which drops the FTS triggers
+    if op.get_bind().dialect.name == 'sqlite':
+        for fts, source in SEARCH_TABLES:
+            for statement in search_triggers(fts, source):
+                op.execute(statement)
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    connection = op.get_bind()
+    for entity, genre_table, key in ENTITIES:
+        table = op.create_table(genre_table,
+        sa.Column(key, sa.Integer(), nullable=False),
+        sa.Column('genre', sa.String(length=120), nullable=False),
+        sa.ForeignKeyConstraint([key], [f'{entity}.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(key, 'genre')
+        )
+        op.create_index(f'ix_{genre_table}_genre', genre_table, ['genre', key], unique=False)
+
+        rows = connection.execute(sa.text(f'SELECT id, genres FROM "{entity}"'))
+        links = [{key: row.id, 'genre': genre} for row in rows for genre in parse_genres(row.genres)]
+        if links:
+            op.bulk_insert(table, links)
+
+        with op.batch_alter_table(entity) as batch_op:
+            batch_op.drop_column('genres')
+    restore_search_triggers()
+
+
+def downgrade():
+    connection = op.get_bind()
+    for entity, genre_table, key in ENTITIES:
+        with op.batch_alter_table(entity) as batch_op:
+            batch_op.add_column(sa.Column('genres', sa.String(length=120), nullable=False, server_default='[]'))
+        with op.batch_alter_table(entity) as batch_op:
+            batch_op.alter_column('genres', server_default=None)
+
+        genres = {}
+        for row in connection.execute(sa.text(f'SELECT {key}, genre FROM {genre_table} ORDER BY genre')):
+            genres.setdefault(row[0], []).append(row[1])
+        for entity_id, names in genres.items():
+            connection.execute(
+                sa.text(f'UPDATE "{entity}" SET genres = :genres WHERE id = :id'),
+                genres=json.dumps(names), id=entity_id)
+
+        op.drop_index(f'ix_{genre_table}_genre', table_name=genre_table)
+        op.drop_table(genre_table)
+    restore_search_triggers()
@@ -0,0 +1,57 @@
+"""updated_at columns
+
+Revision ID: cdea2deb5fa2
+Revises: 5b0f837e5df1
+Create Date: 2026-10-18 12:31:17.194615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cdea2deb5fa2'
+down_revision = '5b0f837e5df1'
+branch_labels = None
+depends_on = None
+
+
+# The name search triggers of the search_indexes revision
+SEARCH_TABLES = (('venue_search', 'Venue'), ('artist_search', 'Artist'))
+
+
+def search_triggers(fts, source):
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN '
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    ]
+
+
+def restore_search_triggers():
+    # SQLite batch mode rebuilds the table, which drops the FTS triggers
+    if op.get_bind().dialect.name == 'sqlite':
+        for fts, source in SEARCH_TABLES:
+            for statement in search_triggers(fts, source):
+                op.execute(statement)
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    # Existing rows take the migration time; SQLite cannot add a column with
+    # a non-constant default in place, hence batch mode
+    for table in ('Artist', 'Show', 'Venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False))
+    restore_search_triggers()
+
+
+def downgrade():
+    for table in ('Venue', 'Show', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
+    restore_search_triggers()
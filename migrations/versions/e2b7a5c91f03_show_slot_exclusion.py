@@ -0,0 +1,35 @@
+"""show slot exclusion
+
+Revision ID: e2b7a5c91f03
+Revises: cdea2deb5fa2
+Create Date: 2026-10-18 13:02:45.530972
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b7a5c91f03'
+down_revision = 'cdea2deb5fa2'
+branch_labels = None
+depends_on = None
+
+# A show holds its venue and artist for three hours from its start time
+SLOT_COLUMNS = ('venue_id', 'artist_id')
+
+
+def upgrade():
+    # Fails if existing shows already overlap; those have to be moved or
+    # removed first. Other databases rely on the booking checks alone.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        for column in SLOT_COLUMNS:
+            op.execute(f'ALTER TABLE "Show" ADD CONSTRAINT "Show_{column}_slot_excl" EXCLUDE USING gist '
+                f"({column} WITH =, tsrange(start_time, start_time + interval '10800 seconds') WITH &&)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for column in SLOT_COLUMNS:
+            op.execute(f'ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "Show_{column}_slot_excl"')
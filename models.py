@@ -1,109 +1,358 @@
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-import json
-
-db = SQLAlchemy()
-migrate = Migrate()
-
-class Venue(db.Model):
-    __tablename__ = 'Venue'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
-    city = db.Column(db.String(120), nullable=False)
-    state = db.Column(db.String(120), nullable=False)
-    address = db.Column(db.String(120), nullable=False)
-    phone = db.Column(db.String(120), nullable=False)
-    image_link = db.Column(db.String(500), nullable=True)
-    facebook_link = db.Column(db.String(120), nullable=True)
-    website_link = db.Column(db.String(120), nullable=True)
-    seeking_talent = db.Column(db.Boolean, nullable=True, default=False)
-    seeking_description = db.Column(db.String(), nullable=True)
-    genres = db.Column(db.String(120), nullable=False)
-    shows = db.relationship('Show', backref='venue', lazy=True)
-   
-    def __repr__(self):
-        return f'<Venue {self.id} {self.name}>'
-
-    def details_for_venue_page(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'city': self.city,
-            'state': self.state,
-            'address': self.address,
-            'phone': self.phone,
-            'image_link': self.image_link,
-            'facebook_link': self.facebook_link,
-            'website_link': self.website_link,
-            'seeking_talent': self.seeking_talent,
-            'seeking_description': self.seeking_description,
-            'genres': json.loads(self.genres),
-            'all_shows': [Show.artist_details(Show.query.get(show.id)) for show in self.shows]
-        }
-
-
-class Artist(db.Model):
-    __tablename__ = 'Artist'
-
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
-    city = db.Column(db.String(120), nullable=False)
-    state = db.Column(db.String(120), nullable=False)
-    phone = db.Column(db.String(120), nullable=False)
-    image_link = db.Column(db.String(500), nullable=True)
-    genres = db.Column(db.String(120), nullable=False)
-    facebook_link = db.Column(db.String(120), nullable=True)
-    website_link = db.Column(db.String(120), nullable=True)
-    seeking_venue = db.Column(db.Boolean, nullable=True, default=False)
-    seeking_description = db.Column(db.String(), nullable=True)
-    shows = db.relationship('Show', backref='artist', lazy=True)
-
-    def __repr__(self):
-        return f'<Artist {self.id} {self.name}>'
-    
-    def details_for_artist_page(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'city': self.city,
-            'state': self.state,
-            'phone': self.phone,
-            'image_link': self.image_link,
-            'genres': json.loads(self.genres),
-            'facebook_link': self.facebook_link,
-            'website_link': self.website_link,
-            'seeking_venue': self.seeking_venue,
-            'seeking_description': self.seeking_description,
-            'all_shows': [Show.venue_details(Show.query.get(show.id)) for show in self.shows]
-        }
-    
-
-class Show(db.Model):
-    __tablename__ = 'Show'
-
-    id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
-    start_time = db.Column(db.DateTime(), nullable=False)
-
-    def __repr__(self):
-        return f'<Show {self.id} {self.start_time}>'
-    
-    def artist_details(self):
-        artist = Artist.query.get(self.artist_id)
-        return {
-            'artist_id': self.artist_id,
-            'artist_name': artist.name,
-            'artist_image_link': artist.image_link,
-            'start_time': self.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        }
-    
-    def venue_details(self):
-        venue = Venue.query.get(self.venue_id)
-        return {
-            'venue_id': self.venue_id,
-            'venue_name': venue.name,
-            'venue_image_link': venue.image_link,
-            'start_time': self.start_time.strftime("%m/%d/%Y, %H:%M:%S")
-        }
+from sqlalchemy import case, event, func, text
+from sqlalchemy.ext.associationproxy import association_proxy
+from datetime import datetime
+
+from database import SQLAlchemy
+
+db = SQLAlchemy()
+
+# Genres live in one row per (entity, genre) so that genre filters are index
+# lookups; the (genre, entity_id) index serves "all venues playing X".
+class VenueGenre(db.Model):
+    __tablename__ = 'venue_genres'
+
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    __table_args__ = (db.Index('ix_venue_genres_genre', 'genre', 'venue_id'),)
+
+
+class ArtistGenre(db.Model):
+    __tablename__ = 'artist_genres'
+
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    __table_args__ = (db.Index('ix_artist_genres_genre', 'genre', 'artist_id'),)
+
+
+class Venue(db.Model):
+    __tablename__ = 'Venue'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    address = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120), nullable=False)
+    image_link = db.Column(db.String(500), nullable=True)
+    facebook_link = db.Column(db.String(120), nullable=True)
+    website_link = db.Column(db.String(120), nullable=True)
+    seeking_talent = db.Column(db.Boolean, nullable=True, default=False)
+    seeking_description = db.Column(db.String(), nullable=True)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+    genre_links = db.relationship('VenueGenre', lazy=True, cascade='all, delete-orphan')
+    genres = association_proxy('genre_links', 'genre', creator=lambda genre: VenueGenre(genre=genre))
+    # Maintained by counters.py
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime(), nullable=True)
+    shows = db.relationship('Show', backref='venue', lazy=True)
+    __table_args__ = (
+        db.Index('ix_Venue_state_city', 'state', 'city'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_next_show_at', 'next_show_at'),
+        # Typeahead indexes catch up through it
+        db.Index('ix_Venue_updated_at', 'updated_at'),
+    )
+   
+    def __repr__(self):
+        return f'<Venue {self.id} {self.name}>'
+
+    @staticmethod
+    def with_genre(query, genre):
+        # Restricts a query over Venue to venues playing genre
+        if not genre:
+            return query
+        return query.filter(Venue.id.in_(
+            db.session.query(VenueGenre.venue_id).filter(VenueGenre.genre == genre)))
+
+    @staticmethod
+    def in_area(state, city, genre=None):
+        # Venues of one (state, city) area, served by ix_Venue_state_city
+        query = db.session.query(Venue.id, Venue.name, Venue.upcoming_show_count, Venue.next_show_at) \
+            .filter(Venue.state == state, Venue.city == city)
+        return Venue.with_genre(query, genre)
+
+    @staticmethod
+    def area_version(state, city):
+        # Changes whenever the area page would: areas.refresh() stamps the
+        # area on every write to its venues and their shows, an upcoming show
+        # starts, or any venue or artist changes. Primary key lookups and a
+        # short index range. None when the area has no venues.
+        return db.session.query(VenueArea.updated_at, VenueArea.next_show_at,
+            Show.started_since(VenueArea.next_show_at, Show.venue_id.in_(
+                db.session.query(Venue.id).filter(Venue.state == state, Venue.city == city))),
+            *table_version(Venue), *table_version(Artist)
+        ).filter(VenueArea.state == state, VenueArea.city == city).first()
+
+    def artist_ids(self):
+        # Artists who have played or will play here, and so list this venue
+        return [row[0] for row in db.session.query(Show.artist_id).filter(Show.venue_id == self.id).distinct()]
+
+    @staticmethod
+    def page_version(venue_id):
+        # Everything the venue page displays changes one of these values: the
+        # venue row, which the counters stamp on every write to its shows; a
+        # show starting, counted from next_show_at until roll-forward moves
+        # it on; or any artist, whose names and images the show tiles carry.
+        # None when the venue does not exist.
+        return db.session.query(Venue.updated_at, Venue.next_show_at,
+            Show.started_since(Venue.next_show_at, Show.venue_id == Venue.id), *table_version(Artist)
+        ).filter(Venue.id == venue_id).first()
+
+    def details_for_venue_page(self, shows_limit=None):
+        details = {
+            'id': self.id,
+            'name': self.name,
+            'city': self.city,
+            'state': self.state,
+            'address': self.address,
+            'phone': self.phone,
+            'image_link': self.image_link,
+            'facebook_link': self.facebook_link,
+            'website_link': self.website_link,
+            'seeking_talent': self.seeking_talent,
+            'seeking_description': self.seeking_description,
+            'genres': list(self.genres),
+            'updated_at': self.updated_at,
+        }
+        details.update(Show.artist_shows_for_venue(self.id, shows_limit))
+        return details
+
+
+# One row per (state, city) with at least one venue, summarising its venues,
+# and one per genre played there. areas.refresh() keeps them in step with
+# the venues, so /venues reads a page of areas without touching Venue.
+class VenueArea(db.Model):
+    __tablename__ = 'venue_areas'
+
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False)
+    upcoming_show_count = db.Column(db.Integer, nullable=False)
+    next_show_at = db.Column(db.DateTime(), nullable=True)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+    __table_args__ = (db.Index('ix_venue_areas_updated_at', 'updated_at'),)
+
+    @staticmethod
+    def version():
+        # refresh() stamps an area whenever it rewrites the area's genres,
+        # so this covers venue_area_genres too
+        return listing_version(VenueArea)
+
+
+class VenueAreaGenre(db.Model):
+    __tablename__ = 'venue_area_genres'
+
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index('ix_venue_area_genres_genre', 'genre', 'state', 'city'),)
+
+
+class Artist(db.Model):
+    __tablename__ = 'Artist'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    phone = db.Column(db.String(120), nullable=False)
+    image_link = db.Column(db.String(500), nullable=True)
+    genre_links = db.relationship('ArtistGenre', lazy=True, cascade='all, delete-orphan')
+    genres = association_proxy('genre_links', 'genre', creator=lambda genre: ArtistGenre(genre=genre))
+    facebook_link = db.Column(db.String(120), nullable=True)
+    website_link = db.Column(db.String(120), nullable=True)
+    seeking_venue = db.Column(db.Boolean, nullable=True, default=False)
+    seeking_description = db.Column(db.String(), nullable=True)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+    # Maintained by counters.py
+    upcoming_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_show_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime(), nullable=True)
+    shows = db.relationship('Show', backref='artist', lazy=True)
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_next_show_at', 'next_show_at'),
+        db.Index('ix_Artist_updated_at', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f'<Artist {self.id} {self.name}>'
+
+    @staticmethod
+    def with_genre(query, genre):
+        # Restricts a query over Artist to artists playing genre
+        if not genre:
+            return query
+        return query.filter(Artist.id.in_(
+            db.session.query(ArtistGenre.artist_id).filter(ArtistGenre.genre == genre)))
+    
+    def venue_ids(self):
+        # Venues this artist has played or will play at
+        return [row[0] for row in db.session.query(Show.venue_id).filter(Show.artist_id == self.id).distinct()]
+
+    @staticmethod
+    def page_version(artist_id):
+        # Same as Venue.page_version, from the artist's side
+        return db.session.query(Artist.updated_at, Artist.next_show_at,
+            Show.started_since(Artist.next_show_at, Show.artist_id == Artist.id), *table_version(Venue)
+        ).filter(Artist.id == artist_id).first()
+
+    def details_for_artist_page(self, shows_limit=None):
+        details = {
+            'id': self.id,
+            'name': self.name,
+            'city': self.city,
+            'state': self.state,
+            'phone': self.phone,
+            'image_link': self.image_link,
+            'genres': list(self.genres),
+            'facebook_link': self.facebook_link,
+            'website_link': self.website_link,
+            'seeking_venue': self.seeking_venue,
+            'seeking_description': self.seeking_description,
+            'updated_at': self.updated_at,
+        }
+        details.update(Show.venue_shows_for_artist(self.id, shows_limit))
+        return details
+    
+
+class Show(db.Model):
+    __tablename__ = 'Show'
+
+    id = db.Column(db.Integer, primary_key=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
+    start_time = db.Column(db.DateTime(), nullable=False)
+    updated_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, server_default=func.now())
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_Show_start_time', 'start_time'),
+        db.Index('ix_Show_updated_at', 'updated_at'),
+    )
+
+    def __repr__(self):
+        return f'<Show {self.id} {self.start_time}>'
+    
+    @staticmethod
+    def split_past_and_upcoming(query, owner_filter, show_details, limit=None):
+        # The split happens against now() in the database; limit caps how
+        # many rows each section loads while the counts stay exact.
+        now = func.now()
+        past_shows = query.filter(Show.start_time < now) \
+            .order_by(Show.start_time.desc(), Show.id.desc()).limit(limit).all()
+        upcoming_shows = query.filter(Show.start_time >= now) \
+            .order_by(Show.start_time, Show.id).limit(limit).all()
+        past_shows_count, upcoming_shows_count = db.session.query(
+            func.count(case([(Show.start_time < now, Show.id)])),
+            func.count(case([(Show.start_time >= now, Show.id)]))
+        ).filter(owner_filter).one()
+        return {
+            'past_shows': [show_details(show) for show in past_shows],
+            'past_shows_count': past_shows_count,
+            'upcoming_shows': [show_details(show) for show in upcoming_shows],
+            'upcoming_shows_count': upcoming_shows_count
+        }
+
+    @staticmethod
+    def started_since(since, *criteria):
+        # Shows matching criteria that started between since, an upcoming
+        # next_show_at column, and now; until `flask roll-forward-shows` moves
+        # since on, that is a few rows of ix_Show_start_time
+        return db.session.query(func.count(Show.id)) \
+            .filter(Show.start_time >= since, Show.start_time < func.now(), *criteria) \
+            .correlate(since.class_).as_scalar()
+
+    @staticmethod
+    def upcoming_in_area(state, city, limit):
+        # The next shows at any venue of a (state, city) area
+        return db.session.query(Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+            Show.artist_id, Artist.name.label('artist_name'), Artist.image_link) \
+            .join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id) \
+            .filter(Venue.state == state, Venue.city == city, Show.start_time >= func.now()) \
+            .order_by(Show.start_time, Show.id).limit(limit).all()
+
+    # Show rows are fetched together with the counterpart's name and image
+    # in a single joined query per section.
+    @staticmethod
+    def artist_shows_for_venue(venue_id, limit=None):
+        query = db.session.query(Show.id, Show.updated_at, Show.artist_id, Show.start_time,
+            Artist.name, Artist.image_link, Artist.updated_at.label('artist_updated_at')) \
+            .join(Artist, Show.artist_id == Artist.id) \
+            .filter(Show.venue_id == venue_id)
+        return Show.split_past_and_upcoming(query, Show.venue_id == venue_id, lambda show: {
+            'id': show.id,
+            'updated_at': show.updated_at,
+            'artist_id': show.artist_id,
+            'artist_name': show.name,
+            'artist_image_link': show.image_link,
+            'artist_updated_at': show.artist_updated_at,
+            'start_time': show.start_time
+        }, limit)
+
+    @staticmethod
+    def venue_shows_for_artist(artist_id, limit=None):
+        query = db.session.query(Show.id, Show.updated_at, Show.venue_id, Show.start_time,
+            Venue.name, Venue.image_link, Venue.updated_at.label('venue_updated_at')) \
+            .join(Venue, Show.venue_id == Venue.id) \
+            .filter(Show.artist_id == artist_id)
+        return Show.split_past_and_upcoming(query, Show.artist_id == artist_id, lambda show: {
+            'id': show.id,
+            'updated_at': show.updated_at,
+            'venue_id': show.venue_id,
+            'venue_name': show.name,
+            'venue_image_link': show.image_link,
+            'venue_updated_at': show.venue_updated_at,
+            'start_time': show.start_time
+        }, limit)
+
+
+# A table changes, as pages taking their ETags from it see it, when the
+# newest updated_at moves, read from the end of its index, or a row goes,
+# which a trigger counts in delete_counts on every statement (Postgres) or
+# row (SQLite) deleting from it. Inserts and updates write no shared row, so
+# concurrent writers do not queue on one; deletes are rare. updated_at is
+# stamped at flush, so a transaction committing after a later-stamped one
+# goes unseen until the next write to the table.
+VERSIONED_TABLES = ('Venue', 'Artist', 'Show', 'venue_areas')
+
+class DeleteCount(db.Model):
+    __tablename__ = 'delete_counts'
+
+    name = db.Column(db.String(64), primary_key=True)
+    deletes = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+
+def table_version(model):
+    # Two columns for a query's select list
+    return (db.session.query(func.max(model.updated_at)).as_scalar(),
+        db.session.query(DeleteCount.deletes).filter(DeleteCount.name == model.__tablename__).as_scalar())
+
+def delete_count_ddl(dialect):
+    statements = ["INSERT INTO delete_counts (name, deletes) VALUES " +
+        ', '.join(f"('{table}', 0)" for table in VERSIONED_TABLES)]
+    if dialect == 'postgresql':
+        statements.append(
+            'CREATE OR REPLACE FUNCTION count_deletes() RETURNS trigger AS $$ BEGIN '
+            'UPDATE delete_counts SET deletes = deletes + 1 WHERE name = TG_TABLE_NAME; '
+            'RETURN NULL; END $$ LANGUAGE plpgsql')
+        statements.extend(f'CREATE TRIGGER "{table}_deletes" AFTER DELETE OR TRUNCATE '
+            f'ON "{table}" FOR EACH STATEMENT EXECUTE PROCEDURE count_deletes()' for table in VERSIONED_TABLES)
+    elif dialect == 'sqlite':
+        statements.extend(f'CREATE TRIGGER "{table}_deletes" AFTER DELETE ON "{table}" '
+            f"BEGIN UPDATE delete_counts SET deletes = deletes + 1 WHERE name = '{table}'; END"
+            for table in VERSIONED_TABLES)
+    return statements
+
+@event.listens_for(db.Model.metadata, 'after_create')
+def _create_delete_counts(target, connection, **kw):
+    if kw.get('tables') is None or DeleteCount.__table__ in kw['tables']:
+        for statement in delete_count_ddl(connection.dialect.name):
+            connection.execute(text(statement))
+
+
+def listing_version(*models):
+    # Version of each table a listing reads, in one query of index lookups
+    return db.session.query(*[column for model in models for column in table_version(model)]).one()
@@ -0,0 +1,76 @@
+from sqlalchemy import DDL, column, event, func, literal_column, table
+from models import db, Venue, Artist
+
+# Name search is backed by a trigram GIN index on Postgres (see the
+# search_indexes migration) and by an FTS5 trigram table on SQLite, so a
+# partial, case-insensitive match never scans the whole table.
+
+FTS_TABLES = {
+    Venue: 'venue_search',
+    Artist: 'artist_search',
+}
+
+def fts_ddl(model):
+    # Statements creating an external-content FTS5 table over model.name,
+    # kept in sync with the model table by triggers
+    source = model.__tablename__
+    fts = FTS_TABLES[model]
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"name, content='{source}', content_rowid='id', tokenize='trigram')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON "{source}" BEGIN '
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON "{source}" BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+# Databases created with db.create_all() (tests, local SQLite files) get
+# the same search structures as migrated ones.
+event.listen(db.metadata, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+for _model in FTS_TABLES:
+    for _statement in fts_ddl(_model):
+        event.listen(_model.__table__, 'after_create',
+            DDL(_statement).execute_if(dialect='sqlite'))
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search(model, term, city=None, state=None, page=1, per_page=20):
+    # Returns one page of {id, name} matches for term, best matches first,
+    # optionally restricted to a city and/or state
+    term = term.strip()
+    query = db.session.query(model.id, model.name)
+    if state:
+        query = query.filter(model.state == state)
+    if city:
+        query = query.filter(model.city.ilike(escape_like(city.strip()), escape='\\'))
+
+    dialect = db.engine.dialect.name
+    if not term:
+        query = query.order_by(model.name, model.id)
+    elif dialect == 'sqlite' and len(term) >= 3:
+        fts = FTS_TABLES[model]
+        fts_table = table(fts, column('rowid'), column('rank'))
+        query = query.join(fts_table, fts_table.c.rowid == model.id) \
+            .filter(literal_column(fts).op('MATCH')('"' + term.replace('"', '""') + '"')) \
+            .order_by(fts_table.c.rank, model.id)
+    else:
+        query = query.filter(model.name.ilike(f'%{escape_like(term)}%', escape='\\'))
+        if dialect == 'postgresql':
+            query = query.order_by(func.similarity(model.name, term).desc(), model.id)
+        else:
+            query = query.order_by(model.name, model.id)
+
+    page = max(page, 1)
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return {
+        "count": query.order_by(None).count(),
+        "data": [{"id": row.id, "name": row.name} for row in rows[:per_page]],
+        "page": page,
+        "has_next": len(rows) > per_page,
+    }
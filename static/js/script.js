@@ -2,3 +2,76 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Show form typeahead: fills the datalist of an input[data-suggest] from the
+// suggest API as a name is typed, and copies the id of the picked
+// "Name (#id)" suggestion into the data-suggest-target field
+Array.prototype.forEach.call(document.querySelectorAll('input[data-suggest]'), function (input) {
+  var list = document.getElementById(input.getAttribute('list'));
+  var target = document.getElementById(input.getAttribute('data-suggest-target'));
+  var timer = null;
+  var latest = 0;
+  input.addEventListener('input', function () {
+    var picked = /\(#(\d+)\)$/.exec(input.value);
+    if (picked) {
+      target.value = picked[1];
+      return;
+    }
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var request = ++latest;
+      fetch(input.getAttribute('data-suggest') + '?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          if (request !== latest) return;
+          list.innerHTML = '';
+          data.suggestions.forEach(function (suggestion) {
+            var option = document.createElement('option');
+            option.value = suggestion.name + ' (#' + suggestion.id + ')';
+            list.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
+
+// Suggested matches on the venue and artist pages: fills a div[data-matches]
+// with a tile per venue or artist the matches API suggests
+Array.prototype.forEach.call(document.querySelectorAll('div[data-matches]'), function (row) {
+  var kind = row.getAttribute('data-matches-kind');
+  fetch(row.getAttribute('data-matches'))
+    .then(function (response) { return response.json(); })
+    .then(function (data) {
+      row.innerHTML = '';
+      if (!data.matches.length) {
+        var empty = document.createElement('p');
+        empty.className = 'col-sm-12 subtitle';
+        empty.textContent = 'No suggestions yet';
+        row.appendChild(empty);
+      }
+      data.matches.forEach(function (match) {
+        var column = document.createElement('div');
+        column.className = 'col-sm-4';
+        var tile = document.createElement('div');
+        tile.className = 'tile tile-show';
+        if (match.image_link) {
+          var image = document.createElement('img');
+          image.src = match.image_link;
+          image.alt = 'Suggested ' + kind.slice(0, -1) + ' image';
+          tile.appendChild(image);
+        }
+        var name = document.createElement('h5');
+        var link = document.createElement('a');
+        link.href = '/' + kind + '/' + match.id;
+        link.textContent = match.name;
+        name.appendChild(link);
+        var details = document.createElement('h6');
+        details.textContent = match.city + ', ' + match.state +
+          (match.shared_genres.length ? ' · ' + match.shared_genres.join(', ') : '');
+        tile.appendChild(name);
+        tile.appendChild(details);
+        column.appendChild(tile);
+        row.appendChild(column);
+      });
+    });
+});
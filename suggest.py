@@ -0,0 +1,254 @@
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+from bisect import bisect_left, insort
+from flask import current_app
+from sqlalchemy import func
+
+from models import db, Venue, Artist
+
+# In-process prefix indexes over venue and artist names for the show form's
+# typeahead. Each is a sorted list of 'normalised name\0id\0name' strings: a
+# lookup bisects to the normalised query and reads on while entries start
+# with it, so it costs O(log n + k) whatever the catalogue size, at roughly
+# 120 bytes per entity. Each worker loads them when it first renders the
+# show form, or on the first lookup, about 4s for a million names. The
+# create, edit and delete handlers update their own worker's copy: writes
+# replace the list with an edited copy, about 25ms at a million names, so
+# lookups take no lock. The other workers pick up changes every
+# SUGGEST_SYNC_SECONDS through updated_at, one copy per sync.
+# Deletes made by another worker only drop out on restart, and booking an id
+# that no longer exists is rejected as before.
+
+SEPARATOR = '\0'
+# updated_at is stamped before a transaction commits, so a sync also rereads
+# rows stamped a little before the newest one it saw last time
+SYNC_OVERLAP = timedelta(minutes=1)
+
+NON_WORD = re.compile(r'[\W_]+')
+
+def normalise(name):
+    # Case, accents and punctuation do not matter when typing a name
+    name = name.casefold()
+    if not name.isascii():
+        name = ''.join(char for char in unicodedata.normalize('NFKD', name) if not unicodedata.combining(char))
+    return NON_WORD.sub(' ', name).strip()
+
+
+class PrefixIndex:
+    def __init__(self, rows=()):
+        self.lock = threading.Lock()
+        self.entries = sorted(self.entry(id, name) for id, name in rows)
+        # Current entry of each id, in a list indexed by id, to find what an
+        # update replaces
+        self.by_id = []
+        for entry in self.entries:
+            self._slot(self.parse(entry)[0], entry)
+
+    @staticmethod
+    def entry(id, name):
+        return f'{normalise(name)}{SEPARATOR}{id}{SEPARATOR}{name}'
+
+    @staticmethod
+    def parse(entry):
+        _, id, name = entry.split(SEPARATOR, 2)
+        return int(id), name
+
+    def _slot(self, id, entry):
+        if id >= len(self.by_id):
+            self.by_id.extend([None] * (id + 1 - len(self.by_id)))
+        self.by_id[id] = entry
+
+    def _discard(self, entries, id):
+        old = self.by_id[id] if id < len(self.by_id) else None
+        if old is not None:
+            i = bisect_left(entries, old)
+            if i < len(entries) and entries[i] == old:
+                del entries[i]
+            self.by_id[id] = None
+
+    def update(self, changes):
+        # changes maps ids to their new name, or to None to drop them. The
+        # changes go into a copy that then replaces entries, so a search
+        # never sees the list shift under it; a batch pays for one copy.
+        with self.lock:
+            changes = {id: None if name is None else self.entry(id, name) for id, name in changes.items()}
+            changes = {id: entry for id, entry in changes.items()
+                if (self.by_id[id] if id < len(self.by_id) else None) != entry}
+            if not changes:
+                return
+            entries = list(self.entries)
+            for id, entry in changes.items():
+                self._discard(entries, id)
+                if entry is not None:
+                    insort(entries, entry)
+                    self._slot(id, entry)
+            self.entries = entries
+
+    def put(self, id, name):
+        self.update({id: name})
+
+    def remove(self, id):
+        self.update({id: None})
+
+    def search(self, prefix, limit):
+        # Readers take no lock: writers never change a list in place
+        prefix = normalise(prefix)
+        if not prefix:
+            return []
+        entries = self.entries
+        results = []
+        i = bisect_left(entries, prefix)
+        while len(results) < limit and i < len(entries) and entries[i].startswith(prefix):
+            id, name = self.parse(entries[i])
+            results.append({'id': id, 'name': name})
+            i += 1
+        return results
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class IndexState:
+    # One app's indexes, kept in app.extensions so that setting up another
+    # app leaves them as they were
+    def __init__(self, kinds, sync_seconds):
+        self.indexes = {}
+        self.synced = {}
+        self.loading = set()
+        # lock guards the dicts above and is never held for a query; loads
+        # holds one lock per kind, so a kind is built once at a time without
+        # holding up lookups of the other
+        self.lock = threading.Lock()
+        self.loads = {kind: threading.Lock() for kind in kinds}
+        self.sync_seconds = sync_seconds
+
+
+class SyncedIndexes:
+    # One in-memory index per kind in each worker, loaded on first use and
+    # brought up to date with other workers' writes through updated_at.
+    # Subclasses build an index from the database and apply changed rows.
+    MODELS = {'artists': Artist, 'venues': Venue}
+    SYNC_SETTING = None
+    EXTENSION = None
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions[self.EXTENSION] = IndexState(self.MODELS, app.config.get(self.SYNC_SETTING, 10))
+
+    @property
+    def state(self):
+        return current_app.extensions[self.EXTENSION]
+
+    def index(self, kind):
+        state = self.state
+        index = state.indexes.get(kind)
+        if index is None:
+            with state.loads[kind]:
+                index = state.indexes.get(kind)
+                if index is None:
+                    index, synced = self.load(kind)
+                    with state.lock:
+                        state.indexes[kind] = index
+                        state.synced[kind] = synced
+        elif time.monotonic() - state.synced[kind][0] >= state.sync_seconds:
+            self.sync(kind)
+        return index
+
+    def warm(self):
+        # Loads the indexes in background threads, so the first keystrokes
+        # in a form do not wait for them
+        app = current_app._get_current_object()
+        state = self.state
+        with state.lock:
+            kinds = [kind for kind in self.MODELS if kind not in state.indexes and kind not in state.loading]
+            state.loading.update(kinds)
+        for kind in kinds:
+            threading.Thread(target=self._warm, args=(app, kind), name=f'{type(self).__name__}-{kind}', daemon=True).start()
+
+    def _warm(self, app, kind):
+        try:
+            with app.app_context():
+                self.index(kind)
+        finally:
+            state = app.extensions[self.EXTENSION]
+            with state.lock:
+                state.loading.discard(kind)
+
+    def load(self, kind):
+        # A new index and its (sync time, watermark)
+        model = self.MODELS[kind]
+        watermark = db.session.query(func.max(model.updated_at)).scalar()
+        index = self.build(kind)
+        return index, (time.monotonic(), watermark)
+
+    def sync(self, kind):
+        # Rows changed since the newest one seen, less the overlap; applying
+        # an unchanged row again is harmless
+        state = self.state
+        model = self.MODELS[kind]
+        _, watermark = state.synced[kind]
+        # Claimed up front so concurrent requests do not all sync
+        state.synced[kind] = (time.monotonic(), watermark)
+        query = db.session.query(model)
+        if watermark is not None:
+            query = query.filter(model.updated_at >= watermark - SYNC_OVERLAP)
+        rows = self.changed(kind, query)
+        if rows:
+            self.apply(kind, state.indexes[kind], rows)
+            newest = max(row.updated_at for row in rows)
+            watermark = max(watermark, newest) if watermark is not None else newest
+        state.synced[kind] = (time.monotonic(), watermark)
+
+    def loaded(self, kind):
+        # This worker's index of kind, or None until it is first used
+        return self.state.indexes.get(kind)
+
+    def build(self, kind):
+        raise NotImplementedError
+
+    def changed(self, kind, query):
+        # The rows of query (filtered to recent changes) that apply() takes,
+        # each with an updated_at
+        raise NotImplementedError
+
+    def apply(self, kind, index, rows):
+        raise NotImplementedError
+
+
+class Suggestions(SyncedIndexes):
+    SYNC_SETTING = 'SUGGEST_SYNC_SECONDS'
+    EXTENSION = 'suggestions'
+
+    def build(self, kind):
+        model = self.MODELS[kind]
+        return PrefixIndex(db.session.query(model.id, model.name).yield_per(10000))
+
+    def changed(self, kind, query):
+        model = self.MODELS[kind]
+        return query.with_entities(model.id, model.name, model.updated_at).all()
+
+    def apply(self, kind, index, rows):
+        index.update({id: name for id, name, _ in rows})
+
+    def search(self, kind, prefix, limit):
+        return self.index(kind).search(prefix, limit)
+
+    def put(self, kind, id, name):
+        # Nothing to update until this worker has loaded the index
+        index = self.loaded(kind)
+        if index is not None:
+            index.put(id, name)
+
+    def remove(self, kind, id):
+        index = self.loaded(kind)
+        if index is not None:
+            index.remove(id)
+
+
+suggestions = Suggestions()
@@ -1,9 +1,62 @@
-from datetime import datetime
-
-def filter_past_shows(item):
-    # Returns true if start time is less that current time hence the show has past
-    return item['start_time'] < datetime.today().strftime("%m/%d/%Y, %H:%M:%S")
-
-def filter_upcoming_shows(item):
-    # Returns true if start time is less that current time hence the show has past
-    return item['start_time'] >= datetime.today().strftime("%m/%d/%Y, %H:%M:%S")
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+def encode_cursor(values):
+    # Turns the sort key of a row into an opaque url-safe token
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, columns):
+    # Returns the sort key stored in a cursor, or None if it is missing or
+    # malformed: anything but a list holding a value of the right type for
+    # each column
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        key = []
+        for column, value in zip(columns, values):
+            python_type = column.type.python_type
+            if value is None and column.nullable:
+                key.append(None)
+            elif python_type is datetime and isinstance(value, str):
+                key.append(datetime.fromisoformat(value))
+            elif isinstance(value, python_type) and not isinstance(value, bool):
+                key.append(value)
+            else:
+                return None
+        return key
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+def keyset_page(query, columns, row_key, per_page, after=None, before=None):
+    # Fetches one page of query ordered by columns (the last one must be unique)
+    # by seeking past a cursor instead of using OFFSET, so deep pages cost the
+    # same as the first one. row_key returns the sort key of a fetched row.
+    after = decode_cursor(after, columns)
+    before = decode_cursor(before, columns)
+    if before is not None:
+        query = query.filter(tuple_(*columns) < tuple_(*before)) \
+            .order_by(*[column.desc() for column in columns])
+    else:
+        if after is not None:
+            query = query.filter(tuple_(*columns) > tuple_(*after))
+        query = query.order_by(*columns)
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+    return {
+        'items': rows,
+        'per_page': per_page,
+        'next_cursor': encode_cursor(row_key(rows[-1])) if rows and has_next else None,
+        'prev_cursor': encode_cursor(row_key(rows[0])) if rows and has_prev else None
+    }